@@ -1,6 +1,7 @@
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
+from langgraph.config import get_stream_writer
 try:
     from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver  # type: ignore
 except ModuleNotFoundError:  # pragma: no cover
@@ -34,16 +35,25 @@ except ModuleNotFoundError:  # pragma: no cover
         "for better async performance.",
         ImportWarning,
     )
-from typing import Dict, List, Any, Optional, Annotated, TYPE_CHECKING
+from typing import Dict, List, Any, Optional, Annotated, AsyncIterator, Awaitable, Callable, Set, TYPE_CHECKING
+import asyncio
 import json
 import uuid
 import os
 import re
 import aiosqlite
+import time
 import traceback
 from llm_client import LLMClient, ModelNotLoadedError
 from typing import TypedDict
 from embeddings import EmbeddingManager
+from context_builder import EditContext, Reference, build_edit_context, context_budget
+from inventory import css_class_id_inventory, html_class_id_inventory, format_inventory
+from edit_scope import EDIT_TARGETS, classify_edit_scope, parse_edit_scope
+from telemetry import current_span, tracer
+from metrics import REGISTRY
+from write_tokens import write_tokens
+from patching import PATCH_INSTRUCTIONS, PatchApplyError, apply_search_replace, parse_search_replace_blocks
 
 if TYPE_CHECKING:
     from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
@@ -56,16 +66,41 @@ class AgentState(TypedDict):
     generated_css: Optional[str]
     generated_js: Optional[str]
     project_name: Optional[str]
-    retrieved_context: Optional[str]
+    retrieved_chunks: Optional[List[Dict[str, Any]]]
+    edit_targets: Optional[List[str]]
+    use_cache: Optional[bool]
+
+
+NODE_DURATION = REGISTRY.histogram("agent_node_duration_seconds", "Time spent in each LangGraph node", ["node"])
+
+SCRATCH_MODES = ("sequential", "parallel", "css_inventory")
+EDIT_SCOPE_MODES = ("all", "rules", "llm")
+EDIT_MODES = ("full", "patch")
+EDIT_NODES = {"index.html": "edit_html", "styles.css": "edit_css", "app.js": "edit_js"}
 
 
 class CodeAssistantAgent:
-    def __init__(self):
+    def __init__(
+        self,
+        scratch_mode: Optional[str] = None,
+        edit_scope_mode: Optional[str] = None,
+        edit_mode: Optional[str] = None,
+    ):
+        self.scratch_mode = scratch_mode or os.getenv("AGENT_SCRATCH_MODE", "sequential")
+        if self.scratch_mode not in SCRATCH_MODES:
+            raise ValueError(f"Unknown scratch mode '{self.scratch_mode}'. Expected one of: {', '.join(SCRATCH_MODES)}")
+        self.edit_scope_mode = edit_scope_mode or os.getenv("AGENT_EDIT_SCOPE", "rules")
+        if self.edit_scope_mode not in EDIT_SCOPE_MODES:
+            raise ValueError(f"Unknown edit scope mode '{self.edit_scope_mode}'. Expected one of: {', '.join(EDIT_SCOPE_MODES)}")
+        self.edit_mode = edit_mode or os.getenv("AGENT_EDIT_MODE", "full")
+        if self.edit_mode not in EDIT_MODES:
+            raise ValueError(f"Unknown edit mode '{self.edit_mode}'. Expected one of: {', '.join(EDIT_MODES)}")
         self.llm_client = LLMClient()
         self.embedding_manager: Optional[EmbeddingManager] = None
         self.memory_cm = None
         self.memory: Optional["AsyncSqliteSaver"] = None
         self.graph: Optional[Any] = None
+        self._index_tasks: Set[asyncio.Task] = set()
         
     async def initialize(self, embedding_manager: EmbeddingManager):
         await self.llm_client.initialize()
@@ -77,6 +112,8 @@ class CodeAssistantAgent:
         self.build_graph()
 
     async def shutdown(self):
+        if self._index_tasks:
+            await asyncio.gather(*self._index_tasks, return_exceptions=True)
         if self.memory_cm:
             await self.memory_cm.__aexit__(None, None, None)
         self.graph = None
@@ -86,20 +123,21 @@ class CodeAssistantAgent:
             return
         workflow = StateGraph(AgentState)
 
-        workflow.add_node("router", self.router_node)
-
-        workflow.add_node("generate_html_from_scratch", self.generate_html_from_scratch_node)
-        workflow.add_node("generate_css_from_scratch", self.generate_css_from_scratch_node)
-        workflow.add_node("generate_js_from_scratch", self.generate_js_from_scratch_node)
-        
-        workflow.add_node("retrieve_context", self.retrieve_context_node)
-
-        workflow.add_node("load_existing_project", self.load_existing_project_node)
-        workflow.add_node("edit_html", self.edit_html_node)
-        workflow.add_node("edit_css", self.edit_css_node)
-        workflow.add_node("edit_js", self.edit_js_node)
-
-        workflow.add_node("assemble_and_create", self.assemble_and_create_node)
+        nodes = {
+            "router": self.router_node,
+            "generate_html_from_scratch": self.generate_html_from_scratch_node,
+            "generate_css_from_scratch": self.generate_css_from_scratch_node,
+            "generate_js_from_scratch": self.generate_js_from_scratch_node,
+            "retrieve_context": self.retrieve_context_node,
+            "classify_edit_scope": self.classify_edit_scope_node,
+            "load_existing_project": self.load_existing_project_node,
+            "edit_html": self.edit_html_node,
+            "edit_css": self.edit_css_node,
+            "edit_js": self.edit_js_node,
+            "assemble_and_create": self.assemble_and_create_node,
+        }
+        for node_name, node in nodes.items():
+            workflow.add_node(node_name, self._traced(node_name, node))
 
         workflow.set_entry_point("router")
 
@@ -108,20 +146,40 @@ class CodeAssistantAgent:
             lambda state: "load_existing_project" if state.get("current_project_path") else "generate_html_from_scratch"
         )
 
-        workflow.add_edge("generate_html_from_scratch", "generate_css_from_scratch")
-        workflow.add_edge("generate_css_from_scratch", "generate_js_from_scratch")
-        workflow.add_edge("generate_js_from_scratch", "assemble_and_create")
+        if self.scratch_mode in ("sequential", "css_inventory"):
+            # css_inventory keeps JS behind CSS but only hands it the stylesheet's selectors.
+            workflow.add_edge("generate_html_from_scratch", "generate_css_from_scratch")
+            workflow.add_edge("generate_css_from_scratch", "generate_js_from_scratch")
+            workflow.add_edge("generate_js_from_scratch", "assemble_and_create")
+        else:
+            # Fan out after the HTML and join once both CSS and JS are done.
+            workflow.add_edge("generate_html_from_scratch", "generate_css_from_scratch")
+            workflow.add_edge("generate_html_from_scratch", "generate_js_from_scratch")
+            workflow.add_edge(["generate_css_from_scratch", "generate_js_from_scratch"], "assemble_and_create")
         
         workflow.add_edge("load_existing_project", "retrieve_context")
-        workflow.add_edge("retrieve_context", "edit_html")
-        workflow.add_edge("edit_html", "edit_css")
-        workflow.add_edge("edit_css", "edit_js")
-        workflow.add_edge("edit_js", "assemble_and_create")
+        workflow.add_edge("retrieve_context", "classify_edit_scope")
+        edit_order = ["edit_html", "edit_css", "edit_js"]
+        for position, source in enumerate(["classify_edit_scope"] + edit_order):
+            remaining = edit_order[position:]
+            workflow.add_conditional_edges(
+                source,
+                lambda state, remaining=remaining: self._next_edit_node(state, remaining),
+                remaining + ["assemble_and_create"],
+            )
 
         workflow.add_edge("assemble_and_create", END)
         
         self.graph = workflow.compile(checkpointer=self.memory)
 
+    def _traced(self, node_name: str, node: Callable[[AgentState], Awaitable[Dict[str, Any]]]):
+        duration = NODE_DURATION.labels(node_name)
+
+        async def run(state: AgentState) -> Dict[str, Any]:
+            with duration.time(), tracer.span(node_name, session=state.get("thread_id")):
+                return await node(state)
+        return run
+
     async def clear_session_state(self, session_id: str):
         if not self.memory:
             print("[WARN] Memory not initialized, cannot clear session state.")
@@ -140,7 +198,7 @@ class CodeAssistantAgent:
             print(f"Error clearing session state from SQLite: {e}")
             traceback.print_exc()
 
-    async def process_message(self, message: str, session_id: str = "default") -> Dict[str, Any]:
+    async def process_message(self, message: str, session_id: str = "default", use_cache: bool = True) -> Dict[str, Any]:
         if not self.graph:
             self.build_graph()
         assert self.graph is not None
@@ -148,17 +206,42 @@ class CodeAssistantAgent:
         config = {"configurable": {"thread_id": session_id}}
         
         final_state = await self.graph.ainvoke(
-            {"messages": [HumanMessage(content=message)], "thread_id": session_id}, 
+            {"messages": [HumanMessage(content=message)], "thread_id": session_id, "use_cache": use_cache}, 
             config
         )
         
+        return self._build_response(final_state)
+
+    async def stream_message(
+        self, message: str, session_id: str = "default", use_cache: bool = True
+    ) -> AsyncIterator[Dict[str, Any]]:
+        if not self.graph:
+            self.build_graph()
+        assert self.graph is not None
+
+        config = {"configurable": {"thread_id": session_id}}
+
+        async for mode, chunk in self.graph.astream(
+            {"messages": [HumanMessage(content=message)], "thread_id": session_id, "use_cache": use_cache},
+            config,
+            stream_mode=["updates", "custom"],
+        ):
+            if mode == "custom":
+                yield chunk
+            elif mode == "updates":
+                for node_name in chunk:
+                    yield {"type": "node_end", "node": node_name}
+
+        snapshot = await self.graph.aget_state(config)
+        yield {"type": "done", **self._build_response(snapshot.values)}
+
+    def _build_response(self, final_state: Dict[str, Any]) -> Dict[str, Any]:
         last_message = final_state['messages'][-1]
-        response = {
+        return {
             "response": last_message.content if isinstance(last_message, AIMessage) else "I'm ready.",
             "project_name": final_state.get("project_name"),
             "project_path": final_state.get("current_project_path")
         }
-        return response
 
     async def retrieve_context_node(self, state: AgentState) -> Dict[str, Any]:
         print("--- Node: retrieve_context ---")
@@ -166,13 +249,76 @@ class CodeAssistantAgent:
         
         if not self.embedding_manager:
             print("[WARN] Embedding manager not initialized. Skipping context retrieval.")
-            return {"retrieved_context": ""}
-
-        retrieved_docs = await self.embedding_manager.retrieve_similar(str(user_message), n_results=3)
+            return {"retrieved_chunks": []}
+
+        started = time.perf_counter()
+        # Only the project being edited is relevant; other projects' snippets just bloat the prompt.
+        # A few extra candidates are fetched because each edit node drops snippets its prompt
+        # already contains and keeps the rest only while they fit its token budget.
+        retrieved_chunks = await self.embedding_manager.retrieve_chunks(
+            str(user_message), n_results=6, project=state.get("project_name")
+        )
+        span = current_span()
+        if span:
+            span.set_attribute("retrieval_ms", (time.perf_counter() - started) * 1000)
+            span.set_attribute("retrieved_docs", len(retrieved_chunks))
+            span.set_attribute("retrieval_degraded", 0 if self.embedding_manager.is_warm() else 1)
         
-        context_str = "\n".join(retrieved_docs)
-        print(f"Retrieved context: {context_str[:300]}...")
-        return {"retrieved_context": context_str}
+        print(f"Retrieved {len(retrieved_chunks)} context chunks.")
+        return {"retrieved_chunks": retrieved_chunks}
+
+    @staticmethod
+    def _edit_context(state: AgentState, node_name: str, target_code: str, references: List[Reference]) -> EditContext:
+        context = build_edit_context(
+            target_code, state.get("retrieved_chunks") or [], references, context_budget(node_name)
+        )
+        span = current_span()
+        if span:
+            span.set_attribute("context_tokens", context.tokens)
+            span.set_attribute("context_snippets", context.snippets_used)
+            span.set_attribute("context_snippets_dropped", context.snippets_dropped)
+            span.set_attribute("context_summarized", len(context.summarized))
+        return context
+
+    @staticmethod
+    def _html_reference(html: str) -> Reference:
+        return Reference("Current HTML", "html", html, lambda code: format_inventory(html_class_id_inventory(code)))
+
+    @staticmethod
+    def _css_reference(css: str) -> Reference:
+        return Reference("Current CSS", "css", css, lambda code: format_inventory(css_class_id_inventory(code)))
+
+    def _next_edit_node(self, state: AgentState, remaining: List[str]) -> str:
+        targets = state.get("edit_targets") or list(EDIT_TARGETS)
+        wanted = {EDIT_NODES[target] for target in targets if target in EDIT_NODES}
+        for node_name in remaining:
+            if node_name in wanted:
+                return node_name
+        return "assemble_and_create"
+
+    async def classify_edit_scope_node(self, state: AgentState) -> Dict[str, Any]:
+        print("--- Node: classify_edit_scope ---")
+        user_message = str(state["messages"][-1].content)
+
+        targets: Optional[List[str]] = None
+        if self.edit_scope_mode != "all":
+            targets = classify_edit_scope(user_message)
+            if targets is None and self.edit_scope_mode == "llm":
+                prompt = f"""A user is editing a website made of index.html, styles.css and app.js.
+**User's instruction:** "{user_message}"
+
+Which files must change to satisfy the instruction? Reply with a comma-separated list of file names and nothing else."""
+                try:
+                    response = await self.llm_client.generate(
+                        prompt, max_tokens=32, use_cache=self._use_cache(state)
+                    )
+                    targets = parse_edit_scope(response)
+                except Exception as e:
+                    print(f"[WARN] Edit scope classification failed, editing all files: {e}")
+
+        targets = targets or list(EDIT_TARGETS)
+        print(f"Edit scope: {', '.join(targets)}")
+        return {"edit_targets": targets}
 
     async def router_node(self, state: AgentState) -> Dict[str, Any]:
         print("--- Router: Checking for existing project ---")
@@ -182,17 +328,39 @@ class CodeAssistantAgent:
             print("No active project. Starting new project workflow.")
         return {}
 
-    async def _generate_code(self, prompt: str, node_name: str) -> str:
+    @staticmethod
+    def _use_cache(state: AgentState) -> bool:
+        return state.get("use_cache") is not False
+
+    async def _generate_code(self, prompt: str, node_name: str, use_cache: bool = True) -> str:
         print(f"--- Running Node: {node_name} ---")
-        code = await self.llm_client.generate(prompt, max_tokens=8192)
+        writer = get_stream_writer()
+        writer({"type": "node_start", "node": node_name})
+
+        chunks: List[str] = []
+        async for chunk in self.llm_client.generate_stream(prompt, max_tokens=8192, use_cache=use_cache):
+            chunks.append(chunk)
+            writer({"type": "token", "node": node_name, "text": chunk})
+        code = "".join(chunks)
         return code.strip().replace("```html", "").replace("```css", "").replace("```javascript", "").replace("```", "").strip()
 
+    async def _edit_code(
+        self, prompt: str, existing_code: str, node_name: str, full_instruction: str, use_cache: bool = True
+    ) -> str:
+        if self.edit_mode == "patch" and existing_code.strip():
+            patch = await self._generate_code(f"{prompt}\n{PATCH_INSTRUCTIONS}\n", node_name, use_cache)
+            try:
+                return apply_search_replace(existing_code, parse_search_replace_blocks(patch))
+            except PatchApplyError as e:
+                print(f"[WARN] {node_name}: patch could not be applied ({e}). Falling back to full regeneration.")
+        return await self._generate_code(f"{prompt}\n{full_instruction}\n", node_name, use_cache)
+
     async def generate_html_from_scratch_node(self, state: AgentState) -> Dict[str, Any]:
         user_message = state["messages"][-1].content
         prompt = rf'''You are an expert web developer. A user wants a website: "{user_message}".
 Generate a complete `index.html` file from scratch that fulfills this request.
 Return ONLY the raw HTML code. Do not include markdown formatting.'''
-        generated_html = await self._generate_code(prompt, "generate_html_from_scratch")
+        generated_html = await self._generate_code(prompt, "generate_html_from_scratch", self._use_cache(state))
         return {"generated_html": generated_html}
 
     async def generate_css_from_scratch_node(self, state: AgentState) -> Dict[str, Any]:
@@ -205,14 +373,15 @@ You have already generated the HTML. Now, write a complete `styles.css` file to
 {generated_html}
 ```
 Return ONLY the raw CSS code. Do not include markdown formatting.'''
-        generated_css = await self._generate_code(prompt, "generate_css_from_scratch")
+        generated_css = await self._generate_code(prompt, "generate_css_from_scratch", self._use_cache(state))
         return {"generated_css": generated_css}
 
     async def generate_js_from_scratch_node(self, state: AgentState) -> Dict[str, Any]:
         user_message = state["messages"][-1].content
         generated_html = state.get("generated_html", "")
-        generated_css = state.get("generated_css", "")
-        prompt = rf'''You are an expert web developer creating a website for a user who wants: "{user_message}".
+        if self.scratch_mode == "sequential":
+            generated_css = state.get("generated_css", "")
+            prompt = rf'''You are an expert web developer creating a website for a user who wants: "{user_message}".
 You have already generated the HTML and CSS. Now, create an `app.js` file to make it interactive.
 **Generated HTML:**
 ```html
@@ -223,7 +392,29 @@ You have already generated the HTML and CSS. Now, create an `app.js` file to mak
 {generated_css}
 ```
 Return ONLY the raw JavaScript code. Do not include markdown formatting.'''
-        generated_js = await self._generate_code(prompt, "generate_js_from_scratch")
+        elif self.scratch_mode == "css_inventory":
+            inventory = format_inventory(css_class_id_inventory(state.get("generated_css") or ""))
+            prompt = rf'''You are an expert web developer creating a website for a user who wants: "{user_message}".
+You have already generated the HTML and CSS. The stylesheet defines rules for these classes and ids.
+Now, create an `app.js` file to make it interactive.
+**Generated HTML:**
+```html
+{generated_html}
+```
+**Styled classes and ids:**
+```
+{inventory}
+```
+Return ONLY the raw JavaScript code. Do not include markdown formatting.'''
+        else:
+            prompt = rf'''You are an expert web developer creating a website for a user who wants: "{user_message}".
+You have already generated the HTML. Now, create an `app.js` file to make it interactive.
+**Generated HTML:**
+```html
+{generated_html}
+```
+Return ONLY the raw JavaScript code. Do not include markdown formatting.'''
+        generated_js = await self._generate_code(prompt, "generate_js_from_scratch", self._use_cache(state))
         return {"generated_js": generated_js}
 
     async def load_existing_project_node(self, state: AgentState) -> Dict[str, Any]:
@@ -253,14 +444,14 @@ Return ONLY the raw JavaScript code. Do not include markdown formatting.'''
     async def edit_html_node(self, state: AgentState) -> Dict[str, Any]:
         user_message = state["messages"][-1].content
         existing_html = state.get("generated_html", "")
-        retrieved_context = state.get("retrieved_context", "")
+        context = self._edit_context(state, "edit_html", existing_html or "", [])
         
         prompt = f"""You are an expert web developer modifying an existing webpage.
 **User's instruction:** "{user_message}"
 
 **Relevant code snippets from the project (for context):**
 ```
-{retrieved_context}
+{context.snippets}
 ```
 
 Your goal is to update the HTML below so it satisfies the user's request **while staying consistent** with any styles or scripts referenced in the context.
@@ -269,42 +460,47 @@ Your goal is to update the HTML below so it satisfies the user's request **while
 ```html
 {existing_html}
 ```
-
-Return ONLY the full, updated raw HTML. Do not include markdown formatting or explanations.
 """
-        edited_html = await self._generate_code(prompt, "edit_html")
+        edited_html = await self._edit_code(
+            prompt,
+            existing_html or "",
+            "edit_html",
+            "Return ONLY the full, updated raw HTML. Do not include markdown formatting or explanations.",
+            self._use_cache(state),
+        )
         return {"generated_html": edited_html}
 
     async def edit_css_node(self, state: AgentState) -> Dict[str, Any]:
         user_message = state["messages"][-1].content
         existing_css = state.get("generated_css", "")
         current_html = state.get("generated_html", "")
-        retrieved_context = state.get("retrieved_context", "")
+        context = self._edit_context(state, "edit_css", existing_css or "", [self._html_reference(current_html or "")])
         
         prompt = f"""You are an expert web developer modifying a website.
 **User's instruction:** "{user_message}"
 
 **Relevant code snippets from the project (for context):**
 ```
-{retrieved_context}
+{context.snippets}
 ```
 
 Your goal is to edit the following CSS to incorporate the user's request.
 The CSS should style the provided HTML.
 
-**Current HTML:**
-```html
-{current_html}
-```
+{context.references[0]}
 
 **Existing CSS (to be modified):**
 ```css
 {existing_css}
 ```
-
-Return ONLY the new, full, raw CSS code. Do not include markdown formatting.
 """
-        edited_css = await self._generate_code(prompt, "edit_css")
+        edited_css = await self._edit_code(
+            prompt,
+            existing_css or "",
+            "edit_css",
+            "Return ONLY the new, full, raw CSS code. Do not include markdown formatting.",
+            self._use_cache(state),
+        )
         return {"generated_css": edited_css}
 
 
@@ -313,36 +509,39 @@ Return ONLY the new, full, raw CSS code. Do not include markdown formatting.
         existing_js = state.get("generated_js", "")
         current_html = state.get("generated_html", "")
         current_css = state.get("generated_css", "")
-        retrieved_context = state.get("retrieved_context", "")
+        context = self._edit_context(
+            state,
+            "edit_js",
+            existing_js or "",
+            [self._html_reference(current_html or ""), self._css_reference(current_css or "")],
+        )
 
         prompt = f"""You are an expert web developer modifying a website.
 **User's instruction:** "{user_message}"
 
 **Relevant code snippets from the project (for context):**
 ```
-{retrieved_context}
+{context.snippets}
 ```
 
 Your goal is to edit the following JavaScript to incorporate the user's request.
 The script should work with the provided HTML and CSS.
 
-**Current HTML:**
-```html
-{current_html}
-```
-**Current CSS:**
-```css
-{current_css}
-```
+{context.references[0]}
+{context.references[1]}
 
 **Existing JavaScript (to be modified):**
 ```javascript
 {existing_js}
 ```
-
-Return ONLY the new, full, raw JavaScript code. Do not include markdown formatting.
 """
-        edited_js = await self._generate_code(prompt, "edit_js")
+        edited_js = await self._edit_code(
+            prompt,
+            existing_js or "",
+            "edit_js",
+            "Return ONLY the new, full, raw JavaScript code. Do not include markdown formatting.",
+            self._use_cache(state),
+        )
         return {"generated_js": edited_js}
 
     async def assemble_and_create_node(self, state: AgentState) -> Dict[str, Any]:
@@ -358,11 +557,26 @@ Return ONLY the new, full, raw JavaScript code. Do not include markdown formatti
         project_path = os.path.join("generated_apps", project_name)
 
         os.makedirs(project_path, exist_ok=True)
+        written = {}
         for filename, content in final_code.items():
-            with open(os.path.join(project_path, filename), 'w', encoding='utf-8') as f:
-                f.write(content)
+            file_path = os.path.join(project_path, filename)
+            # Tell the file watcher this write is ours; the content is indexed below instead.
+            write_tokens.expect(file_path, len(content.encode("utf-8")))
+            try:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+            except OSError:
+                # Whatever ended up on disk was not indexed, so let the watcher pick it up.
+                write_tokens.discard(file_path)
+                raise
+            write_tokens.complete(file_path)
+            written[file_path] = content
         
         print(f"Project files created/updated at: {project_path}")
+        if self.embedding_manager:
+            task = asyncio.create_task(self.embedding_manager.index_contents(written, session=state.get("thread_id")))
+            self._index_tasks.add(task)
+            task.add_done_callback(self._index_tasks.discard)
 
         if state.get("current_project_path"):
              response_msg = f"I have applied the updates to the project."
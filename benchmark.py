@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCRATCH_PROMPTS = [
+    "Create a portfolio site with a hero section and project gallery",
+    "Build a landing page for a tech startup",
+    "Make a restaurant website with menu and contact info",
+    "Generate a blog layout with sidebar navigation",
+]
+
+# Importing main must not pull these in; they belong to lifespan or to optional backends.
+HEAVY_MODULES = (
+    "chromadb", "langgraph", "langchain_core", "watchdog", "google.generativeai",
+    "ollama", "llama_cpp", "sentence_transformers", "uvicorn",
+)
+
+EDIT_PROMPTS = [
+    "Make the header blue",
+    "Add a testimonials section below the projects",
+    "Validate the contact form before submitting",
+    "Increase the font size of the hero title",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+    }
+
+
+async def run_session(client, session_index: int, turns: int, latencies: Dict[str, List[float]], errors: List[str]):
+    session_id = f"bench-{session_index}"
+    for turn in range(turns):
+        if turn == 0:
+            kind, message = "scratch", SCRATCH_PROMPTS[session_index % len(SCRATCH_PROMPTS)]
+        else:
+            kind, message = "edit", EDIT_PROMPTS[(session_index + turn - 1) % len(EDIT_PROMPTS)]
+
+        start = time.perf_counter()
+        response = await client.post(
+            "/api/chat",
+            json={"message": message, "session_id": session_id},
+            timeout=None,
+        )
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            errors.append(f"{session_id} turn {turn}: HTTP {response.status_code} {response.text[:200]}")
+            continue
+        latencies[kind].append(elapsed)
+
+
+async def wait_until_ready(client, timeout: float = 300.0):
+    # The agent and the startup index pass come up in the background after lifespan starts.
+    deadline = time.perf_counter() + timeout
+    while True:
+        response = await client.get("/api/ready", params={"require_index": "true"})
+        if response.status_code == 200:
+            return
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"Server not ready after {timeout:.0f}s: {response.text[:200]}")
+        await asyncio.sleep(0.05)
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    import httpx
+    import main
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: List[str] = []
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            await wait_until_ready(client)
+            start = time.perf_counter()
+            await asyncio.gather(*[
+                run_session(client, index, args.turns, latencies, errors)
+                for index in range(args.sessions)
+            ])
+            wall_time = time.perf_counter() - start
+            metrics = (await client.get("/api/metrics")).json()
+
+    completed = sum(len(values) for values in latencies.values())
+    return {
+        "config": {
+            "sessions": args.sessions,
+            "turns": args.turns,
+            "llm_backend": os.getenv("LLM_BACKEND"),
+            "embedding_backend": os.getenv("EMBEDDING_BACKEND"),
+            "scratch_mode": os.getenv("AGENT_SCRATCH_MODE", "sequential"),
+            "edit_scope": os.getenv("AGENT_EDIT_SCOPE", "rules"),
+            "edit_mode": os.getenv("AGENT_EDIT_MODE", "full"),
+        },
+        "wall_time_s": wall_time,
+        "throughput_rps": completed / wall_time if wall_time else 0.0,
+        "errors": errors,
+        "requests": {kind: summarize(values) for kind, values in latencies.items()},
+        "nodes": {
+            node: {key: stats[key] for key in ("count", "mean_ms", "p50_ms", "p95_ms", "p99_ms")}
+            for node, stats in metrics["nodes"].items()
+        },
+        "node_totals": {node: stats["totals"] for node, stats in metrics["nodes"].items()},
+        "llm_cache": metrics["llm_cache"],
+    }
+
+
+def measure_import_time(module: str = "main") -> Dict[str, Any]:
+    # A fresh interpreter, so nothing this process already imported hides the cost.
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")]))}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    total_us = 0
+    imported: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        imported[name.strip()] = int(cumulative)
+        if name.strip() == module:
+            total_us = int(cumulative)
+    slowest = sorted(
+        ((name, us) for name, us in imported.items() if name != module and "." not in name),
+        key=lambda item: item[1], reverse=True,
+    )[:5]
+    return {
+        "module": module,
+        "total_ms": total_us / 1000,
+        "slowest_ms": {name: us / 1000 for name, us in slowest},
+        "heavy_modules": [name for name in HEAVY_MODULES if name in imported],
+    }
+
+
+def check_import_budget(report: Dict[str, Any], budget_ms: float) -> bool:
+    print(f"\nImport time of main: {report['total_ms']:.0f}ms (budget {budget_ms:.0f}ms)")
+    for name, ms in report["slowest_ms"].items():
+        print(f"  {name:<26}{ms:>8.0f}ms")
+    ok = report["total_ms"] <= budget_ms and not report["heavy_modules"]
+    if report["heavy_modules"]:
+        print(f"[ERROR] Importing main eagerly loads: {', '.join(report['heavy_modules'])}")
+    if report["total_ms"] > budget_ms:
+        print(f"[ERROR] Import time {report['total_ms']:.0f}ms exceeds the {budget_ms:.0f}ms budget")
+    return ok
+
+
+def print_report(report: Dict[str, Any]):
+    config = report["config"]
+    print("\n=== Benchmark results ===")
+    print(", ".join(f"{key}={value}" for key, value in config.items()))
+    print(f"wall time: {report['wall_time_s']:.2f}s, throughput: {report['throughput_rps']:.2f} req/s, errors: {len(report['errors'])}")
+
+    header = f"{'':<28}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}"
+    for title, rows in (("Requests (ms)", report["requests"]), ("Nodes (ms)", report["nodes"])):
+        print(f"\n{title}")
+        print(header)
+        for name, stats in rows.items():
+            print(
+                f"{name:<28}{stats['count']:>7}{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}"
+                f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+            )
+    for error in report["errors"][:10]:
+        print(f"[ERROR] {error}")
+
+
+def prepare_workspace(workdir: str):
+    # main.py resolves generated_apps/, chroma_db/ and frontend/dist relative to the CWD.
+    os.makedirs(os.path.join(workdir, "frontend", "dist"), exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end benchmark for the chat pipeline")
+    parser.add_argument("--sessions", type=int, default=8, help="Number of concurrent chat sessions")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per session (first is from scratch, the rest are edits)")
+    parser.add_argument("--backend", type=str, default="fake", help="LLM_BACKEND to benchmark")
+    parser.add_argument(
+        "--embedding-backend", type=str, default="fake",
+        help="EMBEDDING_BACKEND to benchmark (the default needs no embedding service)",
+    )
+    parser.add_argument("--use-cache", action="store_true", help="Keep the LLM response cache enabled")
+    parser.add_argument("--workdir", type=str, default=None, help="Working directory (defaults to a fresh temp dir)")
+    parser.add_argument("--json", type=str, default=None, help="Also write the report to this JSON file")
+    parser.add_argument("--import-budget-ms", type=float, default=750, help="Fail if `import main` takes longer than this")
+    parser.add_argument("--import-check-only", action="store_true", help="Only run the import-time budget check")
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = args.backend
+    os.environ["EMBEDDING_BACKEND"] = args.embedding_backend
+    if not args.use_cache:
+        os.environ["LLM_CACHE_ENABLED"] = "0"
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    prepare_workspace(args.workdir or tempfile.mkdtemp(prefix="website-builder-bench-"))
+    print(f"Benchmark workspace: {os.getcwd()}")
+
+    import_report = measure_import_time()
+    import_ok = check_import_budget(import_report, args.import_budget_ms)
+    if args.import_check_only:
+        sys.exit(0 if import_ok else 1)
+
+    report = asyncio.run(run_benchmark(args))
+    report["import"] = import_report
+    print_report(report)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if not import_ok:
+        sys.exit(1)
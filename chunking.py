@@ -0,0 +1,223 @@
+import hashlib
+import os
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, NamedTuple, Tuple
+
+TARGET_CHUNK_CHARS = 1200
+MAX_CHUNK_CHARS = 2400
+# Structural segments must cover this share of a file's non-blank characters, otherwise
+# the file is chunked as plain line windows instead.
+MIN_SEGMENT_COVERAGE = 0.8
+
+_VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr",
+}
+# Elements whose children are treated as the top level of the document.
+_CONTAINER_TAGS = {"html", "body"}
+# Lines holding nothing but the doctype, container tags or comments never belong to a segment.
+_HTML_FRAME_RE = re.compile(r"(<!doctype[^>]*>|</?(?:html|body)\b[^>]*>|<!--.*?-->|\s)*", re.IGNORECASE)
+
+Segment = Tuple[int, int]
+
+
+class Chunk(NamedTuple):
+    id: str
+    text: str
+    start_line: int
+    end_line: int
+    kind: str
+
+
+class _TopLevelElementParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack: List[str] = []
+        self.segments: List[Segment] = []
+        self._segment_start = 0
+
+    def _at_top(self) -> bool:
+        return all(tag in _CONTAINER_TAGS for tag in self.stack)
+
+    def handle_starttag(self, tag, attrs):
+        line = self.getpos()[0] - 1
+        if tag in _CONTAINER_TAGS:
+            self.stack.append(tag)
+            return
+        if tag in _VOID_TAGS:
+            if self._at_top():
+                self.segments.append((line, line))
+            return
+        if self._at_top():
+            self._segment_start = line
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in self.stack or tag in _VOID_TAGS:
+            return
+        open_element = not self._at_top()
+        # Unclosed children (<li>, <p>, ...) are closed implicitly by their parent's end tag,
+        # so </body> can also close a top-level element that was never closed itself.
+        while self.stack:
+            if self.stack.pop() == tag:
+                break
+        if open_element and self._at_top():
+            self.segments.append((self._segment_start, self.getpos()[0] - 1))
+
+    def close(self):
+        super().close()
+        if not self._at_top():
+            self.segments.append((self._segment_start, self.getpos()[0] - 1))
+            self.stack = [tag for tag in self.stack if tag in _CONTAINER_TAGS]
+
+
+def _html_segments(lines: List[str]) -> List[Segment]:
+    parser = _TopLevelElementParser()
+    try:
+        parser.feed("\n".join(lines))
+        parser.close()
+    except Exception:
+        return []
+    return parser.segments
+
+
+def _brace_segments(lines: List[str], javascript: bool) -> List[Segment]:
+    # Splits at line ends where brace/bracket depth is back to zero, skipping over strings
+    # and comments. Good enough for generated CSS and JS without a real parser.
+    segments: List[Segment] = []
+    depth = 0
+    in_block_comment = False
+    start = None
+    quotes = "'\"`" if javascript else "'\""
+
+    for index, line in enumerate(lines):
+        position = 0
+        in_string = ""
+        while position < len(line):
+            char = line[position]
+            pair = line[position:position + 2]
+            if in_block_comment:
+                if pair == "*/":
+                    in_block_comment = False
+                    position += 1
+            elif in_string:
+                if char == "\\":
+                    position += 1
+                elif char == in_string:
+                    in_string = ""
+            elif pair == "/*":
+                in_block_comment = True
+                position += 1
+            elif javascript and pair == "//":
+                break
+            elif char in quotes:
+                in_string = char
+            elif char in "{[(":
+                depth += 1
+            elif char in "}])":
+                depth = max(0, depth - 1)
+            position += 1
+
+        if start is None and line.strip():
+            start = index
+        if start is None or depth > 0 or in_block_comment:
+            continue
+
+        stripped = line.strip()
+        continues = False
+        if javascript:
+            # Method chains and dangling operators continue the statement on the next line.
+            next_line = next((candidate.strip() for candidate in lines[index + 1:] if candidate.strip()), "")
+            continues = next_line.startswith((".", "?", ":", "&&", "||", "+", "-", "*", "=")) or stripped.endswith(
+                (",", "=", "+", "-", "*", "(", "&&", "||", "?", ":")
+            )
+        elif stripped.endswith(","):
+            # Selector lists split across lines.
+            continues = True
+        if stripped and not continues:
+            segments.append((start, index))
+            start = None
+
+    if start is not None:
+        segments.append((start, len(lines) - 1))
+    return segments
+
+
+def _segment_chars(lines: List[str], segment: Segment) -> int:
+    return sum(len(line) + 1 for line in lines[segment[0]:segment[1] + 1])
+
+
+def _split_large(lines: List[str], segment: Segment) -> List[Segment]:
+    if _segment_chars(lines, segment) <= MAX_CHUNK_CHARS:
+        return [segment]
+    pieces: List[Segment] = []
+    start, size = segment[0], 0
+    for index in range(segment[0], segment[1] + 1):
+        size += len(lines[index]) + 1
+        if size >= TARGET_CHUNK_CHARS and index < segment[1]:
+            pieces.append((start, index))
+            start, size = index + 1, 0
+    pieces.append((start, segment[1]))
+    return pieces
+
+
+def _merge_small(lines: List[str], segments: List[Segment]) -> List[Segment]:
+    merged: List[Segment] = []
+    for segment in segments:
+        if merged:
+            previous = merged[-1]
+            if _segment_chars(lines, (previous[0], segment[1])) <= TARGET_CHUNK_CHARS:
+                merged[-1] = (previous[0], segment[1])
+                continue
+        merged.append(segment)
+    return merged
+
+
+def _coverage(lines: List[str], segments: List[Segment]) -> float:
+    covered = set()
+    for start, end in segments:
+        covered.update(range(start, end + 1))
+    sizes = [0 if _HTML_FRAME_RE.fullmatch(line) else len(line.strip()) for line in lines]
+    total = sum(sizes)
+    if not total:
+        return 1.0
+    return sum(sizes[index] for index in covered if index < len(sizes)) / total
+
+
+def _line_windows(lines: List[str]) -> List[Segment]:
+    return _split_large(lines, (0, len(lines) - 1)) if lines else []
+
+
+def file_kind(file_path: str) -> str:
+    return os.path.splitext(file_path)[1].lstrip(".").lower()
+
+
+def chunk_file(file_path: str, content: str) -> List[Chunk]:
+    lines = content.splitlines()
+    kind = file_kind(file_path)
+    if kind == "html":
+        segments = _html_segments(lines)
+    elif kind in ("css", "js"):
+        segments = _brace_segments(lines, javascript=kind == "js")
+    else:
+        segments = []
+    if not segments or _coverage(lines, segments) < MIN_SEGMENT_COVERAGE:
+        segments = _line_windows(lines)
+
+    segments = [piece for segment in segments for piece in _split_large(lines, segment)]
+    segments = _merge_small(lines, segments)
+
+    chunks: List[Chunk] = []
+    seen: Dict[str, int] = {}
+    for start, end in segments:
+        text = "\n".join(lines[start:end + 1]).strip()
+        if not text:
+            continue
+        # Ids depend only on the path and chunk text, so unchanged chunks keep their id
+        # when the rest of the file is edited.
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        chunk_id = f"{file_path}#{digest}" + (f"-{occurrence}" if occurrence else "")
+        chunks.append(Chunk(chunk_id, text, start + 1, end + 1, kind))
+    return chunks
@@ -0,0 +1,120 @@
+import os
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from telemetry import estimate_tokens
+
+DEFAULT_CONTEXT_TOKENS = 3000
+
+
+class Reference(NamedTuple):
+    # A supporting file shown to the model next to the file it is editing, e.g. the current
+    # HTML when editing CSS. `summarize` produces a compact stand-in when it does not fit.
+    title: str
+    language: str
+    code: str
+    summarize: Callable[[str], str]
+
+
+class EditContext(NamedTuple):
+    snippets: str
+    references: List[str]
+    tokens: int
+    snippets_used: int
+    snippets_dropped: int
+    summarized: List[str]
+
+
+def context_budget(node_name: str) -> int:
+    # EDIT_CSS_CONTEXT_TOKENS etc. override EDIT_CONTEXT_TOKENS for a single node.
+    value = os.getenv(f"{node_name.upper()}_CONTEXT_TOKENS") or os.getenv("EDIT_CONTEXT_TOKENS")
+    return int(value) if value else DEFAULT_CONTEXT_TOKENS
+
+
+def _normalize(code: str) -> str:
+    return re.sub(r"\s+", " ", code or "").strip()
+
+
+def format_snippet(chunk: Dict[str, Any], text: Optional[str] = None) -> str:
+    text = chunk["text"] if text is None else text
+    if chunk.get("source") and chunk.get("start_line"):
+        return f"--- {chunk['source']} (lines {chunk['start_line']}-{chunk['end_line']}) ---\n{text}"
+    return text
+
+
+def _truncate_lines(text: str, max_tokens: int) -> str:
+    kept: List[str] = []
+    used = 0
+    for line in text.splitlines():
+        cost = estimate_tokens(line + "\n")
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
+
+
+def format_reference(reference: Reference, body: str, summarized: bool) -> str:
+    if summarized:
+        return f"**{reference.title} (summary; the full file is omitted to fit the context budget):**\n```\n{body}\n```"
+    return f"**{reference.title}:**\n```{reference.language}\n{body}\n```"
+
+
+def build_edit_context(
+    target_code: str,
+    chunks: List[Dict[str, Any]],
+    references: List[Reference],
+    budget_tokens: int,
+) -> EditContext:
+    # The file being edited is always sent in full; the budget covers everything around it.
+    # Reference files come first because the edit has to stay consistent with them, then
+    # retrieved snippets in relevance order, skipping code the prompt already contains.
+    remaining = budget_tokens
+    reference_blocks: List[str] = []
+    summarized: List[str] = []
+    present = [_normalize(target_code)]
+
+    for reference in references:
+        full = format_reference(reference, reference.code, summarized=False)
+        if estimate_tokens(full) <= remaining:
+            reference_blocks.append(full)
+            present.append(_normalize(reference.code))
+            remaining -= estimate_tokens(full)
+            continue
+        summary = format_reference(reference, reference.summarize(reference.code), summarized=True)
+        if estimate_tokens(summary) > remaining:
+            summary = format_reference(reference, _truncate_lines(reference.summarize(reference.code), max(remaining - 40, 0)), summarized=True)
+        reference_blocks.append(summary)
+        summarized.append(reference.title)
+        remaining -= estimate_tokens(summary)
+
+    snippets: List[str] = []
+    seen = set()
+    for chunk in chunks:
+        normalized = _normalize(chunk["text"])
+        if not normalized or normalized in seen or any(normalized in code for code in present):
+            continue
+        seen.add(normalized)
+        block = format_snippet(chunk)
+        cost = estimate_tokens(block + "\n")
+        if cost <= remaining:
+            snippets.append(block)
+            remaining -= cost
+            continue
+        # Keep the head of the first snippet that does not fit, then stop.
+        header_cost = estimate_tokens(format_snippet(chunk, "") + "\n...\n")
+        if remaining - header_cost > 50:
+            text = _truncate_lines(chunk["text"], remaining - header_cost)
+            if text:
+                snippets.append(format_snippet(chunk, text + "\n..."))
+                remaining = 0
+        break
+
+    return EditContext(
+        snippets="\n".join(snippets),
+        references=reference_blocks,
+        tokens=budget_tokens - remaining,
+        snippets_used=len(snippets),
+        snippets_dropped=len(chunks) - len(snippets),
+        summarized=summarized,
+    )
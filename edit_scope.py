@@ -0,0 +1,59 @@
+import re
+from typing import List, Optional
+
+EDIT_TARGETS = ("index.html", "styles.css", "app.js")
+
+_STYLE_RE = re.compile(
+    r"\b(colou?rs?|font|fonts|typography|background|bg|padding|margins?|spacing|gap|borders?|rounded|radius|"
+    r"shadows?|gradient|theme|dark(er)?|light(er)?|bright(er)?|bold|italic|underlined?|size|bigger|smaller|"
+    r"larger|wider|narrower|taller|shorter|align(ed|ment)?|cent(er|re)(ed)?|layout|grid|flex(box)?|columns?|"
+    r"responsive|mobile|styles?|styling|css|hover|opacity|transparent|width|height|sticky|fixed|contrast|"
+    r"pastel|minimal(ist)?|modern|elegant|"
+    r"red|orange|yellow|green|blue|purple|violet|pink|black|white|gr[ae]y|teal|cyan|navy|gold|silver|beige)\b",
+    re.IGNORECASE,
+)
+_BEHAVIOUR_RE = re.compile(
+    r"\b(click(s|ed|ing|able)?|interactive|interactivity|toggle[sd]?|scripts?|javascript|js|validat(e|es|ion)|"
+    r"submit(s|ted)?|scroll(s|ing)?|alert|events?|fetch|local ?storage|dynamic(ally)?|animat(e|ed|ion|ions))\b",
+    re.IGNORECASE,
+)
+# Interactive widgets need markup and styling as well as the script that drives them.
+_WIDGET_RE = re.compile(
+    r"\b(modal|popup|pop-up|carousel|slider|slideshow|counter|timer|countdown|dropdown|accordion|tabs|lightbox)\b",
+    re.IGNORECASE,
+)
+_STRUCTURE_RE = re.compile(
+    r"\b(add|adds|insert|include|create|new|remove|delete|drop|rename|reword|rewrite|wording|copy|typo|"
+    r"spelling|say|says|content|html|markup|to read)\b",
+    re.IGNORECASE,
+)
+_ADDITIVE_RE = re.compile(r"\b(add|adds|insert|include|create|new)\b", re.IGNORECASE)
+_QUOTED_TEXT_RE = re.compile(r"[\"“][^\"”]+[\"”]")
+
+
+# Returns None when no rule fires, so the caller can fall back to editing every file.
+def classify_edit_scope(message: str) -> Optional[List[str]]:
+    text = message or ""
+    targets = set()
+
+    if _STRUCTURE_RE.search(text) or _QUOTED_TEXT_RE.search(text):
+        targets.add("index.html")
+        # Newly added markup almost always needs styling to match the rest of the page.
+        if _ADDITIVE_RE.search(text):
+            targets.add("styles.css")
+    if _STYLE_RE.search(text):
+        targets.add("styles.css")
+    if _BEHAVIOUR_RE.search(text):
+        targets.add("app.js")
+    if _WIDGET_RE.search(text):
+        targets.update(EDIT_TARGETS)
+
+    if not targets:
+        return None
+    return [target for target in EDIT_TARGETS if target in targets]
+
+
+def parse_edit_scope(response: str) -> Optional[List[str]]:
+    lowered = (response or "").lower()
+    targets = [target for target in EDIT_TARGETS if target in lowered]
+    return targets or None
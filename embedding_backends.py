@@ -0,0 +1,186 @@
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+from metrics import REGISTRY
+
+EMBEDDING_BATCH_SIZE = REGISTRY.histogram(
+    "embedding_backend_batch_size", "Texts encoded per model call by the in-process embedding backend",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+
+
+class EmbeddingBackend:
+    name = "base"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.name}:{self.model_name}"
+
+    @property
+    def collection_suffix(self) -> str:
+        # Different models produce vectors of different sizes, so each gets its own collection.
+        return re.sub(r"[^a-zA-Z0-9_-]+", "-", self.cache_key).strip("-")
+
+    def chroma_embedding_function(self) -> Optional[Any]:
+        return None
+
+    def embed(self, texts: Sequence[str]) -> List[Any]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class OllamaEmbeddingBackend(EmbeddingBackend):
+    name = "ollama"
+
+    def __init__(self, model_name: Optional[str] = None):
+        from chromadb.utils.embedding_functions import OllamaEmbeddingFunction
+
+        super().__init__(model_name or os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text"))
+        self.function = OllamaEmbeddingFunction(
+            url=os.getenv("OLLAMA_EMBED_URL", "http://localhost:11434/api/embeddings"),
+            model_name=self.model_name
+        )
+
+    @property
+    def collection_suffix(self) -> str:
+        # The original collection predates pluggable backends and keeps its unsuffixed name.
+        return ""
+
+    def chroma_embedding_function(self) -> Optional[Any]:
+        return self.function
+
+    def embed(self, texts: Sequence[str]) -> List[Any]:
+        return self.function(list(texts))
+
+
+class SentenceTransformersBackend(EmbeddingBackend):
+    # Runs the model in-process on one dedicated thread. Callers enqueue their texts and
+    # block on a future; the thread waits a short window after the first request so texts
+    # from concurrent callers are encoded together in a single model call.
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: Optional[str] = None):
+        super().__init__(model_name or os.getenv("SENTENCE_TRANSFORMERS_MODEL", "all-MiniLM-L6-v2"))
+        self.device = os.getenv("SENTENCE_TRANSFORMERS_DEVICE") or None
+        self.window_seconds = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5")) / 1000
+        self.max_batch = int(os.getenv("EMBEDDING_MAX_BATCH", "128"))
+        self.model = None
+        self._load_error: Optional[BaseException] = None
+        self._requests: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, name="sentence-transformers", daemon=True)
+        self._thread.start()
+
+    def _load_model(self):
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(self.model_name, device=self.device)
+
+    def _worker(self):
+        try:
+            self.model = self._load_model()
+            print(f"Loaded sentence-transformers model '{self.model_name}'.")
+        except BaseException as e:
+            self._load_error = e
+            print(f"[ERROR] Could not load sentence-transformers model '{self.model_name}': {e}")
+
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            batch = [request]
+            size = len(request[0])
+            deadline = time.monotonic() + self.window_seconds
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._requests.put(None)
+                    break
+                batch.append(request)
+                size += len(request[0])
+            self._encode(batch)
+
+    def _encode(self, batch: List[tuple]):
+        if self._load_error is not None:
+            for _, future in batch:
+                future.set_exception(RuntimeError(f"sentence-transformers model unavailable: {self._load_error}"))
+            return
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        EMBEDDING_BATCH_SIZE.observe(len(texts))
+        try:
+            vectors = self.model.encode(texts, batch_size=min(len(texts), 64), convert_to_numpy=True)  # type: ignore[union-attr]
+        except BaseException as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        offset = 0
+        for request_texts, future in batch:
+            future.set_result(list(vectors[offset:offset + len(request_texts)]))
+            offset += len(request_texts)
+
+    def embed(self, texts: Sequence[str]) -> List[Any]:
+        if not texts:
+            return []
+        future: Future = Future()
+        self._requests.put((list(texts), future))
+        return future.result()
+
+    def close(self):
+        self._requests.put(None)
+
+
+class FakeEmbeddingBackend(EmbeddingBackend):
+    # Deterministic hashed bag-of-words vectors with an optional fixed latency per call, for
+    # benchmarks and local runs without an embedding service. Texts sharing words land close
+    # together, so retrieval still returns plausible neighbours.
+    name = "fake"
+
+    def __init__(self, model_name: Optional[str] = None):
+        super().__init__(model_name or "hashed-bow")
+        self.dimensions = int(os.getenv("FAKE_EMBEDDING_DIM", "256"))
+        self.latency_ms = float(os.getenv("FAKE_EMBEDDING_LATENCY_MS", "0"))
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimensions] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed(self, texts: Sequence[str]) -> List[Any]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [self._vector(text) for text in texts]
+
+
+EMBEDDING_BACKENDS = {
+    OllamaEmbeddingBackend.name: OllamaEmbeddingBackend,
+    SentenceTransformersBackend.name: SentenceTransformersBackend,
+    FakeEmbeddingBackend.name: FakeEmbeddingBackend,
+}
+
+
+def create_embedding_backend(name: str) -> EmbeddingBackend:
+    backend_class = EMBEDDING_BACKENDS.get(name)
+    if backend_class is None:
+        raise ValueError(f"Unknown embedding backend '{name}'. Expected one of: {', '.join(EMBEDDING_BACKENDS)}")
+    return backend_class()
@@ -0,0 +1,192 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from metrics import REGISTRY
+
+EMBEDDING_CACHE_LOOKUPS = REGISTRY.counter(
+    "embedding_cache_lookups_total", "Embedding cache lookups per text", ["result"]
+)
+QUERY_EMBEDDING_CACHE_LOOKUPS = REGISTRY.counter(
+    "query_embedding_cache_lookups_total", "In-process query embedding cache lookups", ["result"]
+)
+
+
+class EmbeddingCache:
+    # Vectors are stored as raw float32 blobs keyed by (model, sha256(text)), so a 768-dim
+    # embedding costs ~3 KB on disk regardless of how long the source chunk was.
+    def __init__(self, path: str = "embedding_cache.sqlite", max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL, "
+            "last_access REAL NOT NULL, PRIMARY KEY (model, text_hash))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        if not hashes:
+            return {}
+        now = time.time()
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit.
+            for offset in range(0, len(unique), 500):
+                part = unique[offset:offset + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self.conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    (model, *part),
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found],
+                )
+                self.conn.commit()
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        EMBEDDING_CACHE_LOOKUPS.labels("hit").inc(len(found))
+        EMBEDDING_CACHE_LOOKUPS.labels("miss").inc(len(unique) - len(found))
+        return found
+
+    def put_many(self, model: str, items: Dict[str, Any]):
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for text_hash, vector in items.items():
+            array = np.asarray(vector, dtype=np.float32)
+            rows.append((model, text_hash, int(array.shape[0]), array.tobytes(), now))
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self.conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM embeddings")
+            self.conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class CachedEmbeddingFunction:
+    # Wraps any callable that maps a list of texts to a list of vectors. Only texts missing
+    # from the cache are sent to the wrapped function, in a single call, so boilerplate
+    # shared across projects is embedded once.
+    def __init__(self, embed: Callable[[List[str]], Sequence[Any]], model_name: str, cache: Optional[EmbeddingCache]):
+        self.embed = embed
+        self.model_name = model_name
+        self.cache = cache
+
+    def __call__(self, texts: List[str]) -> List[np.ndarray]:
+        if self.cache is None:
+            return [np.asarray(vector, dtype=np.float32) for vector in self.embed(list(texts))]
+
+        hashes = [EmbeddingCache.text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model_name, hashes)
+
+        missing: Dict[str, str] = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in vectors:
+                missing.setdefault(text_hash, text)
+        if missing:
+            computed = self.embed(list(missing.values()))
+            fresh = {
+                text_hash: np.asarray(vector, dtype=np.float32)
+                for text_hash, vector in zip(missing.keys(), computed)
+            }
+            self.cache.put_many(self.model_name, fresh)
+            vectors.update(fresh)
+
+        return [vectors[text_hash] for text_hash in hashes]
+
+
+class QueryEmbeddingCache:
+    # Small in-process LRU for query vectors. Queries are short-lived user messages, so they
+    # stay out of the persistent cache and never evict document vectors there.
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", text).strip().strip(".!?").strip().lower()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        QUERY_EMBEDDING_CACHE_LOOKUPS.labels("miss" if vector is None else "hit").inc()
+        return vector
+
+    def put(self, key: str, vector: Any):
+        with self._lock:
+            self._entries[key] = np.asarray(vector, dtype=np.float32)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,69 +1,602 @@
 import chromadb
-from chromadb.utils.embedding_functions import OllamaEmbeddingFunction
+import asyncio
+import functools
+import hashlib
 import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 from chromadb.config import Settings
+from chunking import chunk_file, file_kind
+from embedding_backends import EmbeddingBackend, create_embedding_backend
+from embedding_cache import CachedEmbeddingFunction, EmbeddingCache, QueryEmbeddingCache
+from index_manifest import IndexManifest
+from keyword_index import KeywordIndex, code_identifiers, reciprocal_rank_fusion
+from metrics import REGISTRY
+
+CHROMA_QUERY_DURATION = REGISTRY.histogram("chroma_query_duration_seconds", "ChromaDB similarity query latency")
+CHROMA_UPSERT_DURATION = REGISTRY.histogram("chroma_upsert_duration_seconds", "ChromaDB upsert latency")
+INDEXED_FILES = REGISTRY.counter("embedding_indexed_files_total", "Files processed by the indexer", ["outcome"])
+EMBEDDED_CHUNKS = REGISTRY.counter("embedding_embedded_chunks_total", "Chunks sent to the embedding function")
+# Bump when the per-chunk metadata layout changes so existing files get their metadata
+# rewritten (without re-embedding) on the next index run.
+METADATA_VERSION = 2
+
+RETRIEVALS = REGISTRY.counter("retrievals_total", "Context retrievals by the path that answered them", ["path"])
+EMBEDDING_JOBS_IN_PROGRESS = REGISTRY.gauge(
+    "embedding_jobs_in_progress", "Vector store jobs queued on or running in the embedding worker pool"
+)
 
 class EmbeddingManager:
-    def __init__(self, db_path="chroma_db", collection_name="code_embeddings"):
+    def __init__(
+        self,
+        db_path="chroma_db",
+        collection_name="code_embeddings",
+        workspace_dir="generated_apps",
+        max_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        backend: Optional[EmbeddingBackend] = None,
+    ):
+        self.workspace_dir = workspace_dir
         self.client = chromadb.PersistentClient(
             path=db_path,
             settings=Settings(allow_reset=True)
         )
         
-        self.embedding_function = OllamaEmbeddingFunction(
-            url="http://localhost:11434/api/embeddings",
-            model_name="nomic-embed-text"
-        )
+        self.backend = backend or create_embedding_backend(os.getenv("EMBEDDING_BACKEND", "ollama").strip().lower())
+        self.embedding_function = self.backend.chroma_embedding_function()
+        if self.backend.collection_suffix:
+            collection_name = f"{collection_name}_{self.backend.collection_suffix}"
         
         self.collection = self.client.get_or_create_collection(
             name=collection_name,
             embedding_function=self.embedding_function # type: ignore
         )
-        print(f"ChromaDB collection '{collection_name}' loaded/created with nomic-embed-text.")
+        print(f"ChromaDB collection '{collection_name}' loaded/created with {self.backend.cache_key}.")
 
-    async def reset(self):
-        print("--- Resetting ChromaDB ---")
+        # Documents and queries are embedded explicitly through the backend and cache; the
+        # collection's own embedding function is only kept so the persisted config stays valid.
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if os.getenv("EMBEDDING_CACHE_ENABLED", "1") != "0":
+            try:
+                self.embedding_cache = EmbeddingCache(
+                    path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite"),
+                    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000")),
+                )
+                print(f"Embedding cache enabled at {self.embedding_cache.path}")
+            except Exception as e:
+                print(f"[WARN] Could not open embedding cache, continuing without it: {e}")
+        self.embedder = CachedEmbeddingFunction(self.backend.embed, self.backend.cache_key, self.embedding_cache)
+        self.query_cache = QueryEmbeddingCache(int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "512")))
+
+        self.manifest = IndexManifest(os.path.join(db_path, f"{collection_name}_manifest.json"))
+        if len(self.manifest) and self.collection.count() == 0:
+            # The vector store was wiped behind our back; the manifest no longer describes it.
+            print("[WARN] Index manifest does not match an empty collection; re-indexing from scratch.")
+            self.manifest.clear()
+            self.manifest.save()
+
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid").strip().lower()
+        if self.retrieval_mode not in ("hybrid", "vector"):
+            raise ValueError(f"Unknown RETRIEVAL_MODE '{self.retrieval_mode}'. Expected 'hybrid' or 'vector'.")
+        # The keyword index lives in memory only. It is rebuilt from the stored documents by
+        # hydrate_keyword_index() in the background, and keyword search returns nothing until then.
+        self.keyword_index = KeywordIndex()
+        self.keyword_ready = False
+
+        # Until the first full index_directory pass finishes, vector retrieval is skipped in
+        # favour of the keyword index so queries neither wait behind nor compete with the
+        # bulk indexing jobs on the worker pool.
+        self.warm = False
+        self.index_progress: Dict[str, Any] = {"state": "pending"}
+        # Only one index_directory pass runs at a time; a pass requested meanwhile is skipped.
+        self._index_lock = asyncio.Lock()
+        # Planning a file reads its chunk ids from the manifest and applying the plan writes
+        # them back, so plan + apply for one path must never overlap with another run's.
+        self._path_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+        # ChromaDB calls block on the embedding HTTP round trip and on SQLite/HNSW writes, so
+        # they run on a bounded pool. The semaphore caps queued + running jobs; callers past
+        # the cap wait on the event loop instead of piling work onto the executor queue.
+        max_workers = max_workers or int(os.getenv("EMBEDDING_WORKERS", "4"))
+        max_pending = max_pending or int(os.getenv("EMBEDDING_MAX_PENDING", str(max_workers * 4)))
+        self.batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+        self.batch_chars = int(os.getenv("EMBEDDING_BATCH_CHARS", "60000"))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embeddings")
+        self._pending = asyncio.Semaphore(max_pending)
+
+    async def _run(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        async with self._pending:
+            EMBEDDING_JOBS_IN_PROGRESS.inc()
+            try:
+                loop = asyncio.get_running_loop()
+                # Cancelling the await drops the job if a worker has not picked it up yet.
+                return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+            finally:
+                EMBEDDING_JOBS_IN_PROGRESS.dec()
+
+    async def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.backend.close()
+        if self.embedding_cache:
+            self.embedding_cache.close()
+            self.embedding_cache = None
+            self.embedder.cache = None
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self.embedding_cache.stats() if self.embedding_cache else None
+
+    def query_cache_stats(self) -> Dict[str, Any]:
+        return self.query_cache.stats()
+
+    def _hydrate_keyword_index(self, page_size: int = 1000):
+        offset = 0
+        while True:
+            page = self.collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            for doc_id, document, metadata in zip(page["ids"], page["documents"] or [], page["metadatas"] or []):
+                self.keyword_index.add(doc_id, document or "", dict(metadata or {}))
+            if len(page["ids"]) < page_size:
+                break
+            offset += page_size
+        print(f"Keyword index hydrated with {len(self.keyword_index)} chunks.")
+
+    async def hydrate_keyword_index(self):
+        await self._run(self._hydrate_keyword_index)
+        self.keyword_ready = True
+
+    def _keyword_search(self, query: str, n_results: int, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if not self.keyword_ready:
+            return []
+        return self.keyword_index.search(query, n_results, filters)
+
+    def is_warm(self) -> bool:
+        return self.warm
+
+    def _reset_sync(self, purge_embedding_cache: bool = False):
+        self.keyword_index.clear()
         self.client.reset()
         self.collection = self.client.get_or_create_collection(
             name=self.collection.name,
             embedding_function=self.embedding_function # type: ignore
         )
+        self.manifest.clear()
+        self.manifest.save()
+        # Cached vectors are keyed by model and text hash and stay valid for a fresh
+        # collection, so they are only dropped on request.
+        if purge_embedding_cache and self.embedding_cache:
+            self.embedding_cache.clear()
+        self.query_cache.clear()
+
+    async def reset(self, purge_embedding_cache: bool = False):
+        print("--- Resetting ChromaDB ---")
+        await self._run(self._reset_sync, purge_embedding_cache)
         print("--- ChromaDB reset complete ---")
 
-    async def index_file(self, file_path: str):
+    def project_for_path(self, file_path: str) -> str:
+        relative = os.path.relpath(os.path.abspath(file_path), os.path.abspath(self.workspace_dir))
+        parts = relative.split(os.sep)
+        if parts[0] != ".." and len(parts) > 1:
+            return parts[0]
+        return os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+
+    def _plan_file_sync(
+        self, file_path: str, session: Optional[str] = None, content: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        # Works out what has to change for one file without touching the collection, so the
+        # single-file and bulk paths can share it. Returns None when the file is unchanged.
+        # Callers that just wrote the file pass its content to skip the re-read.
+        stat = os.stat(file_path)
+        entry = self.manifest.get(file_path)
+        if entry and entry.get("metadata_version") != METADATA_VERSION:
+            entry = {**entry, "size": None, "hash": None}
+        if entry and session and entry.get("session") != session:
+            entry = {**entry, "size": None, "hash": None}
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return None
+
+        if content is None:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        if entry and entry["hash"] == content_hash:
+            # Touched but not changed (e.g. rewritten with identical content).
+            self.manifest.set(file_path, {**entry, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+            return None
+
+        chunks = chunk_file(file_path, content)
+        if entry:
+            existing_ids = set(entry["chunk_ids"])
+        else:
+            existing_ids = set(self.collection.get(where={"source": file_path}, include=[])["ids"])
+
+        session = session or (entry or {}).get("session")
+        base_metadata = {"source": file_path, "project": self.project_for_path(file_path), "file_type": file_kind(file_path)}
+        if session:
+            base_metadata["session"] = session
+        metadatas = [
+            {**base_metadata, "start_line": chunk.start_line, "end_line": chunk.end_line}
+            for chunk in chunks
+        ]
+        # Chunk ids are content hashes, so chunks that already exist only need their line
+        # ranges refreshed; only new chunks are embedded.
+        return {
+            "path": file_path,
+            "stale_ids": list(existing_ids - {chunk.id for chunk in chunks}),
+            "kept": [(chunk.id, metadata) for chunk, metadata in zip(chunks, metadatas) if chunk.id in existing_ids],
+            "new": [(chunk.id, chunk.text, metadata) for chunk, metadata in zip(chunks, metadatas) if chunk.id not in existing_ids],
+            "entry": {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "hash": content_hash,
+                "chunk_ids": [chunk.id for chunk in chunks],
+                "metadata_version": METADATA_VERSION,
+                **({"session": session} if session else {}),
+            },
+        }
+
+    def _apply_plans_sync(self, plans: List[Dict[str, Any]]):
+        stale_ids = [chunk_id for plan in plans for chunk_id in plan["stale_ids"]]
+        if stale_ids:
+            self.collection.delete(ids=stale_ids)
+            self.keyword_index.remove(stale_ids)
+        kept = [item for plan in plans for item in plan["kept"]]
+        if kept:
+            self.collection.update(
+                ids=[chunk_id for chunk_id, _ in kept],
+                metadatas=[metadata for _, metadata in kept],
+            )
+            for chunk_id, metadata in kept:
+                self.keyword_index.update_metadata(chunk_id, metadata)
+
+    def _upsert_batch_sync(self, batch: List[tuple]):
+        documents = [text for _, text, _ in batch]
+        # One embedding call and one write transaction for the whole batch.
+        embeddings = self.embedder(documents)
+        with CHROMA_UPSERT_DURATION.time():
+            self.collection.upsert(
+                ids=[chunk_id for chunk_id, _, _ in batch],
+                documents=documents,
+                metadatas=[metadata for _, _, metadata in batch],
+                embeddings=embeddings,
+            )
+        for chunk_id, text, metadata in batch:
+            self.keyword_index.add(chunk_id, text, metadata)
+        EMBEDDED_CHUNKS.inc(len(batch))
+
+    def _index_file_sync(self, file_path: str, save_manifest: bool = True, session: Optional[str] = None) -> Optional[int]:
+        plan = self._plan_file_sync(file_path, session)
+        if plan is not None:
+            self._apply_plans_sync([plan])
+            if plan["new"]:
+                self._upsert_batch_sync(plan["new"])
+            self.manifest.set(file_path, plan["entry"])
+        if save_manifest:
+            self.manifest.save()
+        return None if plan is None else len(plan["new"])
+
+    def _index_contents_sync(self, files: Dict[str, str], session: Optional[str] = None) -> int:
+        plans = [plan for plan in (self._plan_file_sync(path, session, content) for path, content in files.items()) if plan]
+        if plans:
+            self._apply_plans_sync(plans)
+            new = [item for plan in plans for item in plan["new"]]
+            for batch in self._batches(new):
+                self._upsert_batch_sync(batch)
+            for plan in plans:
+                self.manifest.set(plan["path"], plan["entry"])
+        self.manifest.save()
+        return sum(len(plan["new"]) for plan in plans)
+
+    def _remove_file_sync(self, file_path: str, save_manifest: bool = True):
+        self.collection.delete(where={"source": file_path})
+        self.keyword_index.remove_source(file_path)
+        self.manifest.remove(file_path)
+        if save_manifest:
+            self.manifest.save()
+
+    def _path_lock(self, file_path: str) -> asyncio.Lock:
+        key = os.path.abspath(file_path)
+        lock = self._path_locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._path_locks[key] = lock
+        return lock
+
+    async def _lock_paths(self, file_paths: Sequence[str]) -> Dict[str, asyncio.Lock]:
+        # Always taken in sorted order, so runs that lock several paths cannot deadlock.
+        # Returns the held locks keyed by absolute path; release them with _unlock.
+        locks = {os.path.abspath(path): self._path_lock(path) for path in file_paths}
+        acquired: Dict[str, asyncio.Lock] = {}
+        try:
+            for key in sorted(locks):
+                await locks[key].acquire()
+                acquired[key] = locks[key]
+        except BaseException:
+            self._unlock(acquired)
+            raise
+        return acquired
+
+    @staticmethod
+    def _unlock(locks: Dict[str, asyncio.Lock]):
+        while locks:
+            locks.popitem()[1].release()
+
+    async def index_file(self, file_path: str, save_manifest: bool = True, session: Optional[str] = None):
         if not os.path.exists(file_path):
             print(f"[WARN] File not found, cannot index: {file_path}")
             return
             
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            self.collection.upsert(
-                documents=[content],
-                metadatas=[{"source": file_path}],
-                ids=[file_path]
-            )
-            print(f"Indexed file: {file_path}")
+            async with self._path_lock(file_path):
+                embedded = await self._run(self._index_file_sync, file_path, save_manifest, session)
+            if embedded is None:
+                INDEXED_FILES.labels("unchanged").inc()
+                return
+            INDEXED_FILES.labels("success").inc()
+            print(f"Indexed file: {file_path} ({embedded} new chunks)")
         except Exception as e:
+            INDEXED_FILES.labels("error").inc()
             print(f"Error indexing file {file_path}: {e}")
 
-    async def retrieve_similar(self, query: str, n_results: int = 3) -> list:
+    async def index_contents(self, files: Dict[str, str], session: Optional[str] = None):
+        # Indexes files the caller has just written, from memory and in one batch.
+        try:
+            locks = await self._lock_paths(list(files))
+            try:
+                embedded = await self._run(self._index_contents_sync, files, session)
+            finally:
+                self._unlock(locks)
+            INDEXED_FILES.labels("success").inc(len(files))
+            print(f"Indexed {len(files)} written files ({embedded} new chunks)")
+        except Exception as e:
+            INDEXED_FILES.labels("error").inc(len(files))
+            print(f"Error indexing written files {', '.join(files)}: {e}")
+
+    async def remove_file(self, file_path: str, save_manifest: bool = True):
         try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=n_results
+            async with self._path_lock(file_path):
+                await self._run(self._remove_file_sync, file_path, save_manifest)
+            INDEXED_FILES.labels("removed").inc()
+            print(f"Removed file from index: {file_path}")
+        except Exception as e:
+            print(f"Error removing file {file_path} from index: {e}")
+
+    @staticmethod
+    def build_where(
+        project: Optional[str] = None,
+        file_type: Optional[Union[str, Sequence[str]]] = None,
+        session: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        clauses: List[Dict[str, Any]] = []
+        if project:
+            clauses.append({"project": project})
+        if file_type:
+            if isinstance(file_type, str):
+                clauses.append({"file_type": file_type})
+            else:
+                clauses.append({"file_type": {"$in": list(file_type)}})
+        if session:
+            clauses.append({"session": session})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def _embed_query_sync(self, query: str) -> Any:
+        key = QueryEmbeddingCache.normalize(query)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self.backend.embed([query])[0]
+            self.query_cache.put(key, vector)
+        return vector
+
+    def _query_sync(self, query: str, n_results: int, where: Optional[Dict[str, Any]] = None):
+        query_embedding = self._embed_query_sync(query)
+        with CHROMA_QUERY_DURATION.time():
+            return self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where
             )
-            return results['documents'][0] if results and results['documents'] else []
+
+    @staticmethod
+    def _chunk_from(text: str, metadata: Optional[Dict[str, Any]], distance: Optional[float]) -> Dict[str, Any]:
+        metadata = metadata or {}
+        return {
+            "text": text,
+            "source": metadata.get("source", ""),
+            "project": metadata.get("project"),
+            "file_type": metadata.get("file_type"),
+            "start_line": metadata.get("start_line"),
+            "end_line": metadata.get("end_line"),
+            "distance": distance,
+        }
+
+    async def _vector_search(self, query: str, n_results: int, where: Optional[Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+        try:
+            results = await self._run(self._query_sync, query, n_results, where)
         except Exception as e:
             print(f"Error retrieving similar documents: {e}")
             return []
+        if not results or not results['documents']:
+            return []
+
+        ids = (results.get('ids') or [[]])[0] or []
+        metadatas = (results.get('metadatas') or [[]])[0] or []
+        distances = (results.get('distances') or [[]])[0] or []
+        hits = []
+        for index, document in enumerate(results['documents'][0]):
+            metadata = metadatas[index] if index < len(metadatas) else None
+            distance = distances[index] if index < len(distances) else None
+            chunk_id = ids[index] if index < len(ids) else f"vector-{index}"
+            hits.append((chunk_id, self._chunk_from(document, metadata, distance)))
+        return hits
+
+    async def retrieve_chunks(
+        self,
+        query: str,
+        n_results: int = 3,
+        project: Optional[str] = None,
+        file_type: Optional[Union[str, Sequence[str]]] = None,
+        session: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        # Filters are pushed down into the Chroma where clause, so chunks from other
+        # projects are never scored or returned.
+        where = self.build_where(project, file_type, session)
+        if not self.warm:
+            RETRIEVALS.labels("keyword_warming").inc()
+            keyword_hits = self._keyword_search(
+                query, n_results, {"project": project, "file_type": file_type, "session": session}
+            )
+            return [self._chunk_from(hit["text"], hit["metadata"], None) for hit in keyword_hits]
+
+        if self.retrieval_mode == "vector":
+            RETRIEVALS.labels("vector").inc()
+            return [chunk for _, chunk in await self._vector_search(query, n_results, where)]
+
+        keyword_hits = self._keyword_search(
+            query, n_results * 2, {"project": project, "file_type": file_type, "session": session}
+        )
+        identifiers = code_identifiers(query)
+        if keyword_hits and identifiers and all(identifier in keyword_hits[0]["terms"] for identifier in identifiers):
+            # The query names exact identifiers and the best keyword hit contains all of
+            # them: answer from the keyword index and skip the embedding round trip.
+            RETRIEVALS.labels("keyword").inc()
+            return [self._chunk_from(hit["text"], hit["metadata"], None) for hit in keyword_hits[:n_results]]
+
+        RETRIEVALS.labels("hybrid").inc()
+        vector_hits = await self._vector_search(query, n_results * 2, where)
+        chunks_by_id = {hit["id"]: self._chunk_from(hit["text"], hit["metadata"], None) for hit in keyword_hits}
+        chunks_by_id.update(dict(vector_hits))
+        fused = reciprocal_rank_fusion([[hit["id"] for hit in keyword_hits], [chunk_id for chunk_id, _ in vector_hits]])
+        return [chunks_by_id[chunk_id] for chunk_id in fused[:n_results]]
+
+    async def retrieve_similar(
+        self,
+        query: str,
+        n_results: int = 3,
+        project: Optional[str] = None,
+        file_type: Optional[Union[str, Sequence[str]]] = None,
+        session: Optional[str] = None,
+    ) -> list:
+        chunks = await self.retrieve_chunks(query, n_results, project=project, file_type=file_type, session=session)
+        return [chunk["text"] for chunk in chunks]
+
+    def _batches(self, items: List[tuple]) -> List[List[tuple]]:
+        batches: List[List[tuple]] = []
+        batch: List[tuple] = []
+        batch_chars = 0
+        for item in items:
+            if batch and (len(batch) >= self.batch_size or batch_chars + len(item[1]) > self.batch_chars):
+                batches.append(batch)
+                batch, batch_chars = [], 0
+            batch.append(item)
+            batch_chars += len(item[1])
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _plan_file(self, file_path: str, progress: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            plan = await self._run(self._plan_file_sync, file_path)
+        except Exception as e:
+            INDEXED_FILES.labels("error").inc()
+            print(f"Error indexing file {file_path}: {e}")
+            return None
+        finally:
+            progress["files_scanned"] = progress.get("files_scanned", 0) + 1
+        if plan is None:
+            INDEXED_FILES.labels("unchanged").inc()
+        return plan
+
+    async def _upsert_batch(self, batch: List[tuple], progress: Dict[str, Any]) -> bool:
+        try:
+            await self._run(self._upsert_batch_sync, batch)
+            progress["chunks_embedded"] = progress.get("chunks_embedded", 0) + len(batch)
+            return True
+        except Exception as e:
+            print(f"Error upserting batch of {len(batch)} chunks: {e}")
+            return False
+
+    async def index_directory(self, directory: str, progress: Optional[Dict[str, Any]] = None) -> bool:
+        # Progress is reported into `progress` (index_progress by default, which /api/ready
+        # shows), so background passes can keep theirs apart. Returns False if skipped.
+        if self._index_lock.locked():
+            print(f"Index pass already running, skipping pass over {directory}")
+            return False
+        progress = self.index_progress if progress is None else progress
+        async with self._index_lock:
+            started = time.time()
+            progress.clear()
+            progress.update({"state": "scanning", "directory": directory, "started_at": started})
+            try:
+                await self._index_directory(directory, progress)
+            except BaseException as e:
+                progress.update({"state": "error", "error": f"{type(e).__name__}: {e}"})
+                raise
+            progress.update({"state": "done", "duration_s": time.time() - started})
+            if not self.warm:
+                self.warm = True
+                print(f"Index is warm after {time.time() - started:.1f}s.")
+        return True
 
-    async def index_directory(self, directory: str):
+    async def _index_directory(self, directory: str, progress: Dict[str, Any]):
         print(f"Starting to index directory: {directory}")
+        file_paths = await self._run(self._list_code_files, directory)
+        progress.update({"state": "indexing", "files_total": len(file_paths), "files_scanned": 0})
+
+        # Files are read and chunked concurrently, then new chunks from every file are
+        # embedded and written in size-bounded batches rather than one call per file. Changed
+        # files stay locked until their manifest entry is written; unchanged ones are released
+        # as soon as they have been planned.
+        locks = await self._lock_paths(file_paths)
+        try:
+            await self._index_files(file_paths, progress, locks)
+        finally:
+            self._unlock(locks)
+
+        present = set(file_paths)
+        deleted = [path for path in self.manifest.paths_under(directory) if path not in present]
+        await asyncio.gather(*[self.remove_file(path, save_manifest=False) for path in deleted])
+
+        await self._run(self.manifest.save)
+        print(f"Directory indexing complete ({len(file_paths)} files, {len(deleted)} removed).")
+
+    async def _index_files(self, file_paths: List[str], progress: Dict[str, Any], locks: Dict[str, asyncio.Lock]):
+        plans = []
+        for path, plan in zip(file_paths, await asyncio.gather(*[self._plan_file(path, progress) for path in file_paths])):
+            if plan:
+                plans.append(plan)
+            else:
+                self._unlock({path: locks.pop(os.path.abspath(path))})
+        failed_paths = set()
+        if plans:
+            try:
+                await self._run(self._apply_plans_sync, plans)
+            except Exception as e:
+                print(f"Error updating existing chunks: {e}")
+                failed_paths.update(plan["path"] for plan in plans)
+
+            items = [(plan["path"], item) for plan in plans for item in plan["new"]]
+            batches = self._batches([item for _, item in items])
+            progress.update({"state": "embedding", "chunks_total": len(items), "chunks_embedded": 0})
+            results = await asyncio.gather(*[self._upsert_batch(batch, progress) for batch in batches])
+            failed_ids = {item[0] for batch, ok in zip(batches, results) if not ok for item in batch}
+            failed_paths.update(path for path, item in items if item[0] in failed_ids)
+
+            for plan in plans:
+                if plan["path"] in failed_paths:
+                    # Leave the manifest entry alone so the next run retries this file.
+                    INDEXED_FILES.labels("error").inc()
+                    continue
+                self.manifest.set(plan["path"], plan["entry"])
+                INDEXED_FILES.labels("success").inc()
+            print(f"Embedded {len(items)} new chunks from {len(plans)} changed files in {len(batches)} batches.")
+
+    @staticmethod
+    def _list_code_files(directory: str) -> list:
+        file_paths = []
         for root, _, files in os.walk(directory):
             for file in files:
                 if file.endswith(('.html', '.css', '.js')):
-                    file_path = os.path.join(root, file)
-                    await self.index_file(file_path)
-        print("Directory indexing complete.") 
\ No newline at end of file
+                    file_paths.append(os.path.join(root, file))
+        return file_paths
@@ -2,38 +2,199 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import asyncio
 import os
+from typing import Any, Dict, List, Optional, Set
 
 from embeddings import EmbeddingManager
+from metrics import REGISTRY
+from write_tokens import write_tokens
 
-class CodeFileHandler(FileSystemEventHandler):
-    def __init__(self, embedding_manager, loop):
+WATCHER_EVENTS = REGISTRY.counter("watcher_events_total", "File system events that scheduled a reindex")
+WATCHER_EVENTS_MERGED = REGISTRY.counter(
+    "watcher_events_merged_total", "Events folded into a reindex that was already pending for the same path"
+)
+WATCHER_EVENTS_DROPPED = REGISTRY.counter(
+    "watcher_events_dropped_total", "Reindex jobs dropped because the reindex queue was full"
+)
+WATCHER_EVENTS_SUPPRESSED = REGISTRY.counter(
+    "watcher_events_suppressed_total", "Events ignored because they echo a write the app already indexed"
+)
+WATCHER_RECONCILES = REGISTRY.counter("watcher_reconciles_total", "Periodic index reconciliation passes completed")
+REINDEX_QUEUE_DEPTH = REGISTRY.gauge("watcher_reindex_queue_depth", "Reindex jobs scheduled by the watcher and not yet finished")
+
+
+class ReindexQueue:
+    # Watchdog threads hand paths over with submit(). Each path waits out a debounce window
+    # (restarted by every new event for it), then goes onto a bounded queue drained by a
+    # fixed set of workers. A path that is already debouncing or queued is never added twice.
+    def __init__(
+        self,
+        embedding_manager: EmbeddingManager,
+        loop: asyncio.AbstractEventLoop,
+        debounce_seconds: Optional[float] = None,
+        max_size: Optional[int] = None,
+        workers: Optional[int] = None,
+    ):
         self.embedding_manager = embedding_manager
         self.loop = loop
-        
+        self.debounce_seconds = debounce_seconds if debounce_seconds is not None else float(os.getenv("WATCHER_DEBOUNCE_MS", "300")) / 1000
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(max_size or int(os.getenv("WATCHER_QUEUE_SIZE", "256")))
+        self.worker_count = workers or int(os.getenv("WATCHER_WORKERS", "2"))
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._queued: Set[str] = set()
+        self._workers: List[asyncio.Task] = []
+
+    def start(self):
+        self._workers = [self.loop.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    def stop(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    def submit(self, path: str):
+        # Called from watchdog's thread.
+        self.loop.call_soon_threadsafe(self._debounce, path)
+
+    def _debounce(self, path: str):
+        timer = self._timers.pop(path, None)
+        if timer is not None:
+            timer.cancel()
+            WATCHER_EVENTS_MERGED.inc()
+        self._timers[path] = self.loop.call_later(self.debounce_seconds, self._enqueue, path)
+
+    def _enqueue(self, path: str):
+        self._timers.pop(path, None)
+        if write_tokens.is_echo(path):
+            WATCHER_EVENTS_SUPPRESSED.inc()
+            return
+        if path in self._queued:
+            WATCHER_EVENTS_MERGED.inc()
+            return
+        try:
+            self.queue.put_nowait(path)
+        except asyncio.QueueFull:
+            WATCHER_EVENTS_DROPPED.inc()
+            print(f"[WARN] Reindex queue full, dropping reindex of {path}")
+            return
+        self._queued.add(path)
+        REINDEX_QUEUE_DEPTH.inc()
+
+    async def _worker(self):
+        while True:
+            path = await self.queue.get()
+            # Events arriving from here on schedule a fresh reindex rather than merging into
+            # this one, which may already have read the old content.
+            self._queued.discard(path)
+            try:
+                # Create/modify/delete/move all funnel through here; what is on disk once
+                # the events have settled decides whether the path is indexed or removed.
+                if os.path.exists(path):
+                    await self.embedding_manager.index_file(path)
+                elif self.embedding_manager.manifest.get(path) is not None:
+                    await self.embedding_manager.remove_file(path)
+            except Exception as e:
+                print(f"Error reindexing {path}: {e}")
+            finally:
+                REINDEX_QUEUE_DEPTH.dec()
+                self.queue.task_done()
+
+
+def _is_code_file(path: str) -> bool:
+    return path.endswith(('.html', '.css', '.js'))
+
+
+class CodeFileHandler(FileSystemEventHandler):
+    def __init__(self, reindex_queue: ReindexQueue, embedding_manager: EmbeddingManager):
+        self.reindex_queue = reindex_queue
+        self.embedding_manager = embedding_manager
+
+    def _schedule(self, path: str, action: str):
+        if write_tokens.is_echo(path):
+            WATCHER_EVENTS_SUPPRESSED.inc()
+            return
+        print(f"File {action}: {path}")
+        WATCHER_EVENTS.inc()
+        self.reindex_queue.submit(path)
+
+    def _schedule_directory(self, directory: str, action: str):
+        # Removing or renaming a directory only reports the directory itself, so schedule
+        # every indexed file that lived under it plus any code files now under it.
+        paths = set(self.embedding_manager.manifest.paths_under(directory))
+        for root, _, files in os.walk(directory):
+            paths.update(os.path.join(root, file) for file in files if _is_code_file(file))
+        for path in sorted(paths):
+            self._schedule(path, action)
+
+    def on_created(self, event):
+        if not event.is_directory and _is_code_file(event.src_path):# type: ignore
+            self._schedule(event.src_path, "created") # type: ignore
+
     def on_modified(self, event):
-        if not event.is_directory and event.src_path.endswith(('.html', '.css', '.js')):# type: ignore
-            print(f"File modified: {event.src_path}")
-            asyncio.run_coroutine_threadsafe(
-                self.embedding_manager.index_file(event.src_path), 
-                self.loop
-            )
+        if not event.is_directory and _is_code_file(event.src_path):# type: ignore
+            self._schedule(event.src_path, "modified") # type: ignore
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            self._schedule_directory(event.src_path, "deleted") # type: ignore
+        elif _is_code_file(event.src_path):# type: ignore
+            self._schedule(event.src_path, "deleted") # type: ignore
+
+    def on_moved(self, event):
+        if event.is_directory:
+            self._schedule_directory(event.src_path, "moved away") # type: ignore
+            self._schedule_directory(event.dest_path, "moved in") # type: ignore
+            return
+        if _is_code_file(event.src_path):# type: ignore
+            self._schedule(event.src_path, "moved away") # type: ignore
+        if _is_code_file(event.dest_path):# type: ignore
+            self._schedule(event.dest_path, "moved in") # type: ignore
 
 class FileWatcher:
     def __init__(self):
         self.observer = Observer()
         self.embedding_manager = None
         self.loop = None
-        
+        self.reindex_queue: Optional[ReindexQueue] = None
+        self.reconcile_task: Optional[asyncio.Task] = None
+        self.reconcile_progress: Dict[str, Any] = {}
+        self.directory = "generated_apps"
+
     def start_watching(self, embedding_manager: EmbeddingManager, loop: asyncio.AbstractEventLoop):
         self.embedding_manager = embedding_manager
         self.loop = loop
-        
-        handler = CodeFileHandler(self.embedding_manager, self.loop)
-        self.observer.schedule(handler, "generated_apps", recursive=True)
+        self.reindex_queue = ReindexQueue(embedding_manager, loop)
+        self.reindex_queue.start()
+
+        handler = CodeFileHandler(self.reindex_queue, embedding_manager)
+        self.observer.schedule(handler, self.directory, recursive=True)
         self.observer.start()
+
+        reconcile_seconds = float(os.getenv("WATCHER_RECONCILE_SECONDS", "300"))
+        if reconcile_seconds > 0:
+            self.reconcile_task = loop.create_task(self._reconcile_periodically(reconcile_seconds))
         print("File watcher started")
-    
+
+    async def _reconcile_periodically(self, interval: float):
+        # Self-heals from missed or dropped events: index_directory compares the tree with
+        # the index manifest, so unchanged files cost a stat and nothing is re-embedded.
+        # A pass is skipped while another one (e.g. the startup pass) is still running.
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await self.embedding_manager.index_directory(self.directory, self.reconcile_progress): # type: ignore
+                    WATCHER_RECONCILES.inc()
+            except Exception as e:
+                print(f"Error reconciling index with {self.directory}: {e}")
+
     def stop_watching(self):
         self.observer.stop()
         self.observer.join()
-        print("File watcher stopped")
\ No newline at end of file
+        if self.reconcile_task:
+            self.reconcile_task.cancel()
+            self.reconcile_task = None
+        if self.reindex_queue:
+            self.reindex_queue.stop()
+        print("File watcher stopped")
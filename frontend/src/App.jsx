@@ -8,6 +8,7 @@ function App() {
   const [projectPath, setProjectPath] = useState(null); 
   const [showPreview, setShowPreview] = useState(false);
   const [previewVersion, setPreviewVersion] = useState(0);
+  const [progress, setProgress] = useState(null);
 
   useEffect(() => {
     if (messages.length === 0) {
@@ -17,6 +18,55 @@ function App() {
     }
   }, []);
 
+  const streamChat = async (message) => {
+    const response = await fetch('/api/chat/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ message, session_id: 'default' })
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Stream request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let received = 0;
+    let result = null;
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+        if (!dataLine) continue;
+
+        const event = JSON.parse(dataLine.slice('data: '.length));
+        if (event.type === 'node_start') {
+          received = 0;
+          setProgress(`Running ${event.node}…`);
+        } else if (event.type === 'token') {
+          received += event.text.length;
+          setProgress(`Running ${event.node}… (${received} chars)`);
+        } else if (event.type === 'done') {
+          result = event;
+        } else if (event.type === 'error') {
+          throw new Error(event.detail);
+        }
+      }
+    }
+
+    if (!result) {
+      throw new Error('Stream ended before the agent finished.');
+    }
+    return result;
+  };
+
   const sendMessage = async (message) => {
     if (!message.trim() || loading) return;
 
@@ -26,10 +76,7 @@ function App() {
     setLoading(true);
 
     try {
-      const { data } = await axios.post('/api/chat', {
-        message,
-        session_id: 'default'
-      });
+      const data = await streamChat(message);
       
       setMessages(prev => [...prev, { role: 'assistant', content: data.response }]);
       
@@ -44,6 +91,7 @@ function App() {
       setMessages(prev => [...prev, { role: 'assistant', content: 'Sorry, there was an error processing your request.' }]);
     } finally {
       setLoading(false);
+      setProgress(null);
     }
   };
 
@@ -111,7 +159,7 @@ function App() {
           ))}
           {loading && (
             <div className="message assistant">
-              <div className="message-content">Thinking…</div>
+              <div className="message-content">{progress || 'Thinking…'}</div>
             </div>
           )}
         </div>
@@ -0,0 +1,66 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+
+class IndexManifest:
+    # Persisted record of what is in the vector store for each indexed file:
+    # {path: {"size", "mtime_ns", "hash", "chunk_ids"}}.
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Could not read index manifest {path}, starting empty: {e}")
+                self._entries = {}
+
+    def get(self, file_path: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(file_path)
+            return dict(entry) if entry else None
+
+    def set(self, file_path: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[file_path] = entry
+            self._dirty = True
+
+    def remove(self, file_path: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.pop(file_path, None)
+            self._dirty = self._dirty or entry is not None
+            return entry
+
+    def paths_under(self, directory: str) -> List[str]:
+        prefix = os.path.join(directory, "")
+        with self._lock:
+            return [path for path in self._entries if path.startswith(prefix)]
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def save(self):
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                snapshot = json.dumps(self._entries)
+                self._dirty = False
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(snapshot)
+            os.replace(temp_path, self.path)
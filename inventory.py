@@ -0,0 +1,40 @@
+import re
+from typing import List
+
+_CLASS_ATTR_RE = re.compile(r'\bclass\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+_ID_ATTR_RE = re.compile(r'\bid\s*=\s*["\']([^"\']*)["\']', re.IGNORECASE)
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_PRELUDE_RE = re.compile(r"([^{};]+)\{")
+_CSS_SELECTOR_NAME_RE = re.compile(r"[.#][A-Za-z_-][\w-]*")
+
+
+def html_class_id_inventory(html: str) -> List[str]:
+    selectors: List[str] = []
+    seen = set()
+    for match in _ID_ATTR_RE.finditer(html or ""):
+        value = match.group(1).strip()
+        if value and f"#{value}" not in seen:
+            seen.add(f"#{value}")
+            selectors.append(f"#{value}")
+    for match in _CLASS_ATTR_RE.finditer(html or ""):
+        for name in match.group(1).split():
+            if f".{name}" not in seen:
+                seen.add(f".{name}")
+                selectors.append(f".{name}")
+    return selectors
+
+
+def css_class_id_inventory(css: str) -> List[str]:
+    # Only rule preludes are scanned, so hex colours and decimals in declarations are ignored.
+    selectors: List[str] = []
+    seen = set()
+    for match in _CSS_PRELUDE_RE.finditer(_CSS_COMMENT_RE.sub("", css or "")):
+        for name in _CSS_SELECTOR_NAME_RE.findall(match.group(1)):
+            if name not in seen:
+                seen.add(name)
+                selectors.append(name)
+    return selectors
+
+
+def format_inventory(selectors: List[str]) -> str:
+    return "\n".join(selectors) if selectors else "(none)"
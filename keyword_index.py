@@ -0,0 +1,163 @@
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+_IDENTIFIER_RE = re.compile(r"[#.]?[A-Za-z_$][\w$-]*")
+_CAMEL_RE = re.compile(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])")
+
+
+def _identifier_parts(identifier: str) -> List[str]:
+    parts = []
+    for piece in re.split(r"[-_$]+", identifier):
+        parts.extend(match.lower() for match in _CAMEL_RE.findall(piece))
+    return parts
+
+
+def tokenize(text: str) -> List[str]:
+    # Whole identifiers ("hero-title", "togglemenu") are kept as tokens alongside their
+    # parts ("hero", "title", "toggle", "menu"), so both exact and prose queries match.
+    tokens = []
+    for match in _IDENTIFIER_RE.findall(text):
+        identifier = match.lstrip("#.")
+        if not identifier:
+            continue
+        tokens.append(identifier.lower())
+        parts = _identifier_parts(identifier)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def code_identifiers(query: str) -> List[str]:
+    # Query words that can only be code: selectors, kebab/snake case and camelCase names.
+    identifiers = []
+    for match in _IDENTIFIER_RE.findall(query):
+        identifier = match.lstrip("#.")
+        if not identifier:
+            continue
+        if match[0] in "#." or re.search(r"[-_$]", identifier) or re.search(r"[a-z][A-Z]", identifier):
+            identifiers.append(identifier.lower())
+    return identifiers
+
+
+class KeywordIndex:
+    # In-memory BM25 over the same chunks as the vector store. Searches only touch the
+    # postings of the query terms, so they cost microseconds rather than an embedding call.
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._by_source: Dict[str, Set[str]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, doc_id: str, text: str, metadata: Dict[str, Any]):
+        counts = Counter(tokenize(text))
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._docs[doc_id] = {"text": text, "metadata": dict(metadata), "terms": counts, "length": sum(counts.values())}
+            self._total_length += sum(counts.values())
+            for term, count in counts.items():
+                self._postings.setdefault(term, {})[doc_id] = count
+            self._by_source.setdefault(metadata.get("source", ""), set()).add(doc_id)
+
+    def update_metadata(self, doc_id: str, metadata: Dict[str, Any]):
+        with self._lock:
+            doc = self._docs.get(doc_id)
+            if doc is not None:
+                doc["metadata"].update(metadata)
+
+    def remove(self, doc_ids: Iterable[str]):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove_locked(doc_id)
+
+    def remove_source(self, source: str):
+        with self._lock:
+            for doc_id in list(self._by_source.get(source, ())):
+                self._remove_locked(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._by_source.clear()
+            self._total_length = 0
+
+    def _remove_locked(self, doc_id: str):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc["length"]
+        for term in doc["terms"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        source_ids = self._by_source.get(doc["metadata"].get("source", ""))
+        if source_ids is not None:
+            source_ids.discard(doc_id)
+            if not source_ids:
+                del self._by_source[doc["metadata"].get("source", "")]
+
+    @staticmethod
+    def _matches(metadata: Dict[str, Any], filters: Dict[str, Union[str, Sequence[str]]]) -> bool:
+        for key, wanted in filters.items():
+            value = metadata.get(key)
+            if isinstance(wanted, str):
+                if value != wanted:
+                    return False
+            elif value not in wanted:
+                return False
+        return True
+
+    def search(self, query: str, n_results: int, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        terms = set(tokenize(query))
+        filters = {key: value for key, value in (filters or {}).items() if value}
+        with self._lock:
+            doc_count = len(self._docs)
+            if not doc_count or not terms:
+                return []
+            average_length = self._total_length / doc_count or 1.0
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    length = self._docs[doc_id]["length"]
+                    denominator = frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / denominator
+
+            ranked: List[Tuple[str, float]] = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            results = []
+            for doc_id, score in ranked:
+                doc = self._docs[doc_id]
+                if filters and not self._matches(doc["metadata"], filters):
+                    continue
+                results.append({
+                    "id": doc_id,
+                    "text": doc["text"],
+                    "metadata": dict(doc["metadata"]),
+                    "terms": doc["terms"],
+                    "score": score,
+                })
+                if len(results) >= n_results:
+                    break
+            return results
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
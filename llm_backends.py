@@ -0,0 +1,396 @@
+import asyncio
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, List, Optional
+
+
+class LLMBackend:
+    name = "base"
+    failure_hints: List[str] = []
+
+    def __init__(self, model_name: str, system_instruction: str):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+    async def initialize(self):
+        raise NotImplementedError
+
+    def is_loaded(self) -> bool:
+        raise NotImplementedError
+
+    async def generate(self, prompt: str, max_tokens: int) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    async def shutdown(self):
+        pass
+
+    def _messages(self, prompt: str) -> List[dict]:
+        return [
+            {"role": "system", "content": self.system_instruction},
+            {"role": "user", "content": prompt},
+        ]
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+    failure_hints = [
+        "An invalid or missing GOOGLE_API_KEY in your .env file.",
+        "Network issues preventing connection to Google's servers.",
+    ]
+
+    def __init__(self, model_name: Optional[str] = None, system_instruction: str = ""):
+        super().__init__(model_name or os.getenv("GEMINI_MODEL", "gemini-2.0-flash"), system_instruction)
+        self.model = None
+
+    async def initialize(self):
+        import google.generativeai as genai
+
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables.")
+
+        genai.configure(api_key=api_key) # type: ignore
+
+        self.model = genai.GenerativeModel( # type: ignore
+            self.model_name,
+             system_instruction=self.system_instruction
+        )
+
+    def is_loaded(self) -> bool:
+        return self.model is not None
+
+    async def generate(self, prompt: str, max_tokens: int) -> str:
+        assert self.model is not None
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        assert self.model is not None
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without parts (e.g. the final finish_reason chunk) have no text.
+                continue
+            if text:
+                yield text
+
+
+class OllamaBackend(LLMBackend):
+    name = "ollama"
+    failure_hints = [
+        "The Ollama server is not running (start it with `ollama serve`).",
+        "The model has not been pulled yet (run `ollama pull <model>`).",
+    ]
+
+    def __init__(self, model_name: Optional[str] = None, system_instruction: str = ""):
+        super().__init__(model_name or os.getenv("OLLAMA_MODEL", "qwen2.5-coder:7b"), system_instruction)
+        self.host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+        self.client: Any = None
+
+    async def initialize(self):
+        import ollama
+
+        self.client = ollama.AsyncClient(host=self.host)
+        # Fails fast when the server is down or the model is missing.
+        await self.client.show(self.model_name)
+
+    def is_loaded(self) -> bool:
+        return self.client is not None
+
+    async def generate(self, prompt: str, max_tokens: int) -> str:
+        response = await self.client.chat(
+            model=self.model_name,
+            messages=self._messages(prompt),
+            options={"num_predict": max_tokens},
+        )
+        return response["message"]["content"]
+
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        parts = await self.client.chat(
+            model=self.model_name,
+            messages=self._messages(prompt),
+            options={"num_predict": max_tokens},
+            stream=True,
+        )
+        async for part in parts:
+            text = part["message"]["content"]
+            if text:
+                yield text
+
+
+class LlamaCppBackend(LLMBackend):
+    name = "llamacpp"
+    failure_hints = [
+        "llama-cpp-python is not installed.",
+        "LLAMA_CPP_MODEL_PATH does not point to a readable GGUF model file.",
+    ]
+
+    _STREAM_END = object()
+
+    def __init__(self, model_name: Optional[str] = None, system_instruction: str = ""):
+        self.model_path = os.getenv("LLAMA_CPP_MODEL_PATH", "")
+        super().__init__(model_name or os.path.basename(self.model_path) or "llamacpp", system_instruction)
+        self.pool_size = max(1, int(os.getenv("LLAMA_CPP_POOL_SIZE", "1")))
+        self.n_ctx = int(os.getenv("LLAMA_CPP_N_CTX", "8192"))
+        self.n_gpu_layers = int(os.getenv("LLAMA_CPP_N_GPU_LAYERS", "0"))
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.pool: Optional["asyncio.Queue[Any]"] = None
+
+    async def initialize(self):
+        from llama_cpp import Llama
+
+        if not self.model_path or not os.path.isfile(self.model_path):
+            raise ValueError(f"LLAMA_CPP_MODEL_PATH '{self.model_path}' is not a file.")
+
+        # Each Llama instance is single-threaded, so every pooled model gets its own worker thread.
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="llamacpp")
+        loop = asyncio.get_running_loop()
+        models = await asyncio.gather(*[
+            loop.run_in_executor(
+                self.executor,
+                lambda: Llama(
+                    model_path=self.model_path,
+                    n_ctx=self.n_ctx,
+                    n_gpu_layers=self.n_gpu_layers,
+                    verbose=False,
+                ),
+            )
+            for _ in range(self.pool_size)
+        ])
+        self.pool = asyncio.Queue()
+        for model in models:
+            self.pool.put_nowait(model)
+        print(f"Loaded {self.pool_size} llama.cpp model instance(s) from {self.model_path}")
+
+    def is_loaded(self) -> bool:
+        return self.pool is not None
+
+    def _release(self, model: Any):
+        if self.pool is not None:
+            self.pool.put_nowait(model)
+
+    async def generate(self, prompt: str, max_tokens: int) -> str:
+        assert self.pool is not None
+        model = await self.pool.get()
+        loop = asyncio.get_running_loop()
+        worker = loop.run_in_executor(
+            self.executor,
+            lambda: model.create_chat_completion(messages=self._messages(prompt), max_tokens=max_tokens),
+        )
+        # The model goes back to the pool only once its worker has actually stopped using it.
+        worker.add_done_callback(lambda _future: self._release(model))
+        response = await asyncio.shield(worker)
+        return response["choices"][0]["message"]["content"] or ""
+
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        assert self.pool is not None
+        model = await self.pool.get()
+        loop = asyncio.get_running_loop()
+        queue: "asyncio.Queue[Any]" = asyncio.Queue()
+        stop = threading.Event()
+
+        def run():
+            try:
+                for part in model.create_chat_completion(
+                    messages=self._messages(prompt), max_tokens=max_tokens, stream=True
+                ):
+                    if stop.is_set():
+                        break
+                    text = part["choices"][0]["delta"].get("content")
+                    if text:
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, self._STREAM_END)
+
+        worker = loop.run_in_executor(self.executor, run)
+        worker.add_done_callback(lambda _future: self._release(model))
+        try:
+            while True:
+                item = await queue.get()
+                if item is self._STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    async def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False)
+        self.executor = None
+        self.pool = None
+
+
+FAKE_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Fake Site</title>
+    <link rel="stylesheet" href="styles.css">
+</head>
+<body>
+    <header class="site-header">
+        <nav class="nav">
+            <a class="nav-logo" href="#">Fake Site</a>
+            <button id="menu-toggle" class="nav-toggle">Menu</button>
+            <ul class="nav-links">
+                <li><a href="#about">About</a></li>
+                <li><a href="#projects">Projects</a></li>
+                <li><a href="#contact">Contact</a></li>
+            </ul>
+        </nav>
+    </header>
+    <main>
+        <section id="hero" class="hero">
+            <h1 class="hero-title">Hello, world</h1>
+            <p class="hero-subtitle">A deterministic page produced by the fake LLM backend.</p>
+        </section>
+        <section id="about" class="about">
+            <h2>About</h2>
+            <p>This content is canned so that benchmarks do not depend on a live model.</p>
+        </section>
+        <section id="projects" class="projects">
+            <article class="card"><h3>Project One</h3><p>First project.</p></article>
+            <article class="card"><h3>Project Two</h3><p>Second project.</p></article>
+            <article class="card"><h3>Project Three</h3><p>Third project.</p></article>
+        </section>
+        <section id="contact" class="contact">
+            <form id="contact-form">
+                <input type="email" name="email" placeholder="Email" required>
+                <button type="submit">Send</button>
+            </form>
+        </section>
+    </main>
+    <footer class="site-footer"><p>&copy; Fake Site</p></footer>
+    <script src="app.js"></script>
+</body>
+</html>"""
+
+FAKE_CSS = """* { box-sizing: border-box; margin: 0; padding: 0; }
+body { font-family: system-ui, sans-serif; line-height: 1.6; color: #222; }
+.site-header { background: #111; color: #fff; padding: 1rem 2rem; }
+.nav { display: flex; align-items: center; justify-content: space-between; }
+.nav-logo { color: #fff; font-weight: 700; text-decoration: none; }
+.nav-toggle { display: none; }
+.nav-links { display: flex; gap: 1.5rem; list-style: none; }
+.nav-links a { color: #ddd; text-decoration: none; }
+.hero { padding: 6rem 2rem; text-align: center; background: linear-gradient(135deg, #4f46e5, #06b6d4); color: #fff; }
+.hero-title { font-size: 3rem; }
+.about, .projects, .contact { padding: 4rem 2rem; }
+.projects { display: grid; grid-template-columns: repeat(auto-fit, minmax(220px, 1fr)); gap: 1.5rem; }
+.card { padding: 1.5rem; border-radius: 12px; box-shadow: 0 4px 16px rgba(0, 0, 0, 0.08); }
+#contact-form { display: flex; gap: 0.5rem; }
+.site-footer { padding: 2rem; text-align: center; background: #f4f4f5; }
+@media (max-width: 640px) {
+    .nav-toggle { display: block; }
+    .nav-links { display: none; }
+    .nav-links.open { display: flex; flex-direction: column; }
+}"""
+
+FAKE_JS = """document.addEventListener('DOMContentLoaded', () => {
+    const toggle = document.getElementById('menu-toggle');
+    const links = document.querySelector('.nav-links');
+    if (toggle && links) {
+        toggle.addEventListener('click', () => links.classList.toggle('open'));
+    }
+
+    const form = document.getElementById('contact-form');
+    if (form) {
+        form.addEventListener('submit', (event) => {
+            event.preventDefault();
+            alert('Thanks for getting in touch!');
+        });
+    }
+});"""
+
+
+# Deterministic stand-in for a real model, used for benchmarks and offline development.
+# Latency and token rate are drawn per prompt from a seeded RNG, so identical prompts
+# always take the same time and produce the same text.
+class FakeBackend(LLMBackend):
+    name = "fake"
+
+    def __init__(self, model_name: Optional[str] = None, system_instruction: str = ""):
+        super().__init__(model_name or "fake", system_instruction)
+        self.latency_ms = float(os.getenv("FAKE_LLM_LATENCY_MS", "200"))
+        self.latency_jitter_ms = float(os.getenv("FAKE_LLM_LATENCY_JITTER_MS", "50"))
+        self.tokens_per_sec = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "250"))
+        self.tokens_per_sec_jitter = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC_JITTER", "25"))
+        self.seed = os.getenv("FAKE_LLM_SEED", "0")
+        self.chars_per_token = 4
+        self.tokens_per_chunk = 16
+        self.loaded = False
+
+    async def initialize(self):
+        self.loaded = True
+
+    def is_loaded(self) -> bool:
+        return self.loaded
+
+    def _response_for(self, prompt: str) -> str:
+        if "Which files must change" in prompt:
+            return "index.html, styles.css, app.js"
+
+        if "Existing HTML (to be modified)" in prompt:
+            code, addition = FAKE_HTML, "<!-- edited -->"
+        elif "Existing CSS (to be modified)" in prompt:
+            code, addition = FAKE_CSS, "/* edited */"
+        elif "Existing JavaScript (to be modified)" in prompt:
+            code, addition = FAKE_JS, "// edited"
+        elif "`styles.css`" in prompt:
+            return FAKE_CSS
+        elif "`app.js`" in prompt:
+            return FAKE_JS
+        else:
+            return FAKE_HTML
+
+        if "SEARCH/REPLACE" in prompt:
+            return f"<<<<<<< SEARCH\n=======\n{addition}\n>>>>>>> REPLACE"
+        return f"{code}\n{addition}"
+
+    def _timings(self, prompt: str):
+        rng = random.Random(f"{self.seed}:{prompt}")
+        first_token_delay = max(0.0, rng.gauss(self.latency_ms, self.latency_jitter_ms)) / 1000
+        tokens_per_sec = max(1.0, rng.gauss(self.tokens_per_sec, self.tokens_per_sec_jitter))
+        return first_token_delay, tokens_per_sec
+
+    async def generate(self, prompt: str, max_tokens: int) -> str:
+        parts = [part async for part in self.stream(prompt, max_tokens)]
+        return "".join(parts)
+
+    async def stream(self, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        response = self._response_for(prompt)[: max_tokens * self.chars_per_token]
+        first_token_delay, tokens_per_sec = self._timings(prompt)
+        await asyncio.sleep(first_token_delay)
+
+        chunk_chars = self.chars_per_token * self.tokens_per_chunk
+        for start in range(0, len(response), chunk_chars):
+            chunk = response[start:start + chunk_chars]
+            await asyncio.sleep(len(chunk) / self.chars_per_token / tokens_per_sec)
+            yield chunk
+
+
+BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    OllamaBackend.name: OllamaBackend,
+    LlamaCppBackend.name: LlamaCppBackend,
+    FakeBackend.name: FakeBackend,
+}
+
+
+def create_backend(name: str, system_instruction: str) -> LLMBackend:
+    backend_class = BACKENDS.get(name)
+    if backend_class is None:
+        raise ValueError(f"Unknown LLM backend '{name}'. Expected one of: {', '.join(BACKENDS)}")
+    return backend_class(system_instruction=system_instruction)
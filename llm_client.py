@@ -1,54 +1,294 @@
 import os
+import asyncio
+import time
 import traceback
-import google.generativeai as genai
 from dotenv import load_dotenv
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from llm_cache import LLMResponseCache
+from llm_backends import LLMBackend, create_backend
+from telemetry import current_span, estimate_tokens
+from metrics import REGISTRY
+
+LLM_REQUESTS = REGISTRY.counter("llm_requests_total", "LLM requests by backend and outcome", ["backend", "outcome"])
+LLM_REQUEST_DURATION = REGISTRY.histogram(
+    "llm_request_duration_seconds", "Latency of LLM calls that reached the backend", ["backend"]
+)
+LLM_COALESCED_REQUESTS = REGISTRY.counter(
+    "llm_coalesced_requests_total", "LLM requests that joined an identical in-flight request"
+)
+
+SYSTEM_INSTRUCTION = "You are a world-class web developer and AI assistant. Your task is to generate or modify HTML, CSS, and JavaScript code based on user requests. Follow all instructions precisely. Return only the raw code for the requested file type, without any markdown formatting like ```html or ```."
 
 class ModelNotLoadedError(Exception):
     pass
 
-class LLMClient:
+# Concurrent callers with the same key share one task. The task is only cancelled
+# once every caller waiting on it has gone away.
+class SingleFlight:
+
+    class _Flight:
+        def __init__(self, task: "asyncio.Future[Any]"):
+            self.task = task
+            self.waiters = 0
+
     def __init__(self):
-        self.model = None
-        
-    async def initialize(self):
+        self._flights: Dict[str, "SingleFlight._Flight"] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task, flight=flight: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+            LLM_COALESCED_REQUESTS.inc()
+
+        flight.waiters += 1
         try:
-            load_dotenv()
-            api_key = os.getenv("GOOGLE_API_KEY")
-            if not api_key:
-                raise ValueError("GOOGLE_API_KEY not found in environment variables.")
-            
-            genai.configure(api_key=api_key) # type: ignore
-            
-            self.model = genai.GenerativeModel( # type: ignore
-                'gemini-2.0-flash',
-                 system_instruction="You are a world-class web developer and AI assistant. Your task is to generate or modify HTML, CSS, and JavaScript code based on user requests. Follow all instructions precisely. Return only the raw code for the requested file type, without any markdown formatting like ```html or ```."
-            )
-            print("Gemini 2.0 Flash model initialized successfully.")
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: str, flight: "SingleFlight._Flight"):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+
+# SingleFlight for async iterators: one producer task drains the source, and every
+# subscriber replays the chunks produced so far before following along live.
+class StreamingSingleFlight:
+
+    class _Flight:
+        def __init__(self):
+            self.chunks: List[str] = []
+            self.finished = False
+            self.error: Optional[BaseException] = None
+            self.updated = asyncio.Event()
+            self.subscribers = 0
+            self.task: Optional["asyncio.Task[None]"] = None
+
+        def notify(self):
+            updated, self.updated = self.updated, asyncio.Event()
+            updated.set()
+
+    def __init__(self):
+        self._flights: Dict[str, "StreamingSingleFlight._Flight"] = {}
+        self.coalesced = 0
+
+    async def _produce(self, key: str, flight: "StreamingSingleFlight._Flight", factory: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
         except Exception as e:
-            print("="*50)
-            print("!!! FAILED TO INITIALIZE GEMINI MODEL !!!")
-            print(f"Underlying error: {e}")
-            print("="*50)
-            print("This might be due to:")
-            print("1. An invalid or missing GOOGLE_API_KEY in your .env file.")
-            print("2. Network issues preventing connection to Google's servers.")
-            print("\nThe application will continue but will fail on any generation task.")
-            traceback.print_exc()
-            self.model = None
-    
-    async def generate(self, prompt: str, max_tokens: int = 8192) -> str:
-        if not self.model:
-            raise ModelNotLoadedError("Gemini model is not loaded. Cannot generate text.")
+            # Stored rather than raised so the producer task never logs an unretrieved exception.
+            flight.error = e
+        finally:
+            flight.finished = True
+            self._forget(key, flight)
+            flight.notify()
+
+    async def subscribe(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(self._produce(key, flight, factory))
+        else:
+            self.coalesced += 1
+            LLM_COALESCED_REQUESTS.inc()
+
+        flight.subscribers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(flight.chunks):
+                    yield flight.chunks[position]
+                    position += 1
+                if flight.finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.updated.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.finished and flight.task is not None:
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: str, flight: "StreamingSingleFlight._Flight"):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+
+class LLMClient:
+    def __init__(self, backend: Optional[LLMBackend] = None, cache: Optional[LLMResponseCache] = None):
+        self.backend = backend
+        self.system_instruction = SYSTEM_INSTRUCTION
+        self.cache = cache
+        self._single_flight = SingleFlight()
+        self._stream_single_flight = StreamingSingleFlight()
+
+    @property
+    def model_name(self) -> str:
+        if not self.backend:
+            return ""
+        return f"{self.backend.name}:{self.backend.model_name}"
         
+    async def initialize(self):
+        load_dotenv()
+        if self.backend is None:
+            self.backend = create_backend(os.getenv("LLM_BACKEND", "gemini"), self.system_instruction)
+
+        if not self.backend.is_loaded():
+            try:
+                await self.backend.initialize()
+                print(f"LLM backend '{self.model_name}' initialized successfully.")
+            except Exception as e:
+                print("="*50)
+                print(f"!!! FAILED TO INITIALIZE LLM BACKEND '{self.model_name}' !!!")
+                print(f"Underlying error: {e}")
+                print("="*50)
+                print("This might be due to:")
+                for number, hint in enumerate(self.backend.failure_hints, start=1):
+                    print(f"{number}. {hint}")
+                print("\nThe application will continue but will fail on any generation task.")
+                traceback.print_exc()
+
+        if self.cache is None and os.getenv("LLM_CACHE_ENABLED", "1") != "0":
+            try:
+                self.cache = LLMResponseCache(
+                    path=os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite"),
+                    ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+                    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000")),
+                )
+                print(f"LLM response cache enabled at {self.cache.path}")
+            except Exception as e:
+                print(f"[WARN] Could not open LLM response cache, continuing without it: {e}")
+                self.cache = None
+
+    def _cache_key(self, prompt: str, max_tokens: int) -> str:
+        return LLMResponseCache.make_key(
+            self.model_name, self.system_instruction, prompt, {"max_tokens": max_tokens}
+        )
+    
+    def _record_call(self, prompt: str, response: str, started: float, cache_hit: bool):
+        LLM_REQUESTS.labels(self.model_name, "cache_hit" if cache_hit else "success").inc()
+        span = current_span()
+        if span is None:
+            return
+        span.add("llm_calls")
+        span.add("llm_cache_hits", 1 if cache_hit else 0)
+        span.add("prompt_tokens", estimate_tokens(prompt))
+        span.add("response_tokens", estimate_tokens(response))
+        span.add("llm_ms", (time.perf_counter() - started) * 1000)
+    
+    async def generate(self, prompt: str, max_tokens: int = 8192, use_cache: bool = True) -> str:
+        started = time.perf_counter()
+        request_key = self._cache_key(prompt, max_tokens)
+        if use_cache and self.cache:
+            cached = await asyncio.to_thread(self.cache.get, request_key)
+            if cached is not None:
+                self._record_call(prompt, cached, started, cache_hit=True)
+                return cached
+
+        if not self.is_loaded():
+            raise ModelNotLoadedError("LLM backend is not loaded. Cannot generate text.")
+
+        generated_text = await self._single_flight.do(
+            request_key, lambda: self._generate_uncached(prompt, max_tokens, request_key)
+        )
+        self._record_call(prompt, generated_text, started, cache_hit=False)
+        return generated_text
+
+    async def _generate_uncached(self, prompt: str, max_tokens: int, request_key: str) -> str:
+        assert self.backend is not None
         try:
-            response = await self.model.generate_content_async(prompt)
+            with LLM_REQUEST_DURATION.labels(self.model_name).time():
+                response = await self.backend.generate(prompt, max_tokens)
             
-            generated_text = response.text
-            return generated_text.strip()
-                
+            generated_text = response.strip()
         except Exception as e:
+            LLM_REQUESTS.labels(self.model_name, "error").inc()
             print(f"LLM Generation Error: {e}")
             raise Exception(f"Failed to generate response: {e}")
+
+        if self.cache:
+            await asyncio.to_thread(self.cache.put, request_key, generated_text)
+        return generated_text
+
+    async def generate_stream(self, prompt: str, max_tokens: int = 8192, use_cache: bool = True) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        request_key = self._cache_key(prompt, max_tokens)
+        if use_cache and self.cache:
+            cached = await asyncio.to_thread(self.cache.get, request_key)
+            if cached is not None:
+                self._record_call(prompt, cached, started, cache_hit=True)
+                yield cached
+                return
+
+        if not self.is_loaded():
+            raise ModelNotLoadedError("LLM backend is not loaded. Cannot generate text.")
+
+        chunks: List[str] = []
+        async for chunk in self._stream_single_flight.subscribe(
+            request_key, lambda: self._stream_uncached(prompt, max_tokens, request_key)
+        ):
+            chunks.append(chunk)
+            yield chunk
+        self._record_call(prompt, "".join(chunks), started, cache_hit=False)
+
+    async def _stream_uncached(self, prompt: str, max_tokens: int, request_key: str) -> AsyncIterator[str]:
+        assert self.backend is not None
+        chunks: List[str] = []
+        started = time.perf_counter()
+        try:
+            async for text in self.backend.stream(prompt, max_tokens):
+                chunks.append(text)
+                yield text
+
+        except Exception as e:
+            LLM_REQUESTS.labels(self.model_name, "error").inc()
+            print(f"LLM Streaming Error: {e}")
+            raise Exception(f"Failed to stream response: {e}")
+
+        LLM_REQUEST_DURATION.labels(self.model_name).observe(time.perf_counter() - started)
+        if self.cache:
+            await asyncio.to_thread(self.cache.put, request_key, "".join(chunks).strip())
+
+    def coalescing_stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self._single_flight.in_flight() + self._stream_single_flight.in_flight(),
+            "coalesced": self._single_flight.coalesced + self._stream_single_flight.coalesced,
+        }
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self.cache.stats() if self.cache else None
+
+    async def clear_cache(self):
+        if self.cache:
+            await asyncio.to_thread(self.cache.clear)
     
+    async def shutdown(self):
+        if self.backend:
+            await self.backend.shutdown()
+        if self.cache:
+            self.cache.close()
+            self.cache = None
+
     def is_loaded(self) -> bool:
-        return self.model is not None
\ No newline at end of file
+        return self.backend is not None and self.backend.is_loaded()
@@ -1,32 +1,75 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import os
 import asyncio
-from typing import Dict, Any, Optional
-import uvicorn
+import json
+import time
+from typing import Dict, Any, Optional, TYPE_CHECKING
 import argparse
 import traceback
 import shutil
 import zipfile
-from agent import CodeAssistantAgent
 from contextlib import asynccontextmanager
-from embeddings import EmbeddingManager
-from file_watcher import FileWatcher
+from telemetry import tracer
+from metrics import REGISTRY
 
-agent = CodeAssistantAgent()
-embedding_manager = EmbeddingManager()
-file_watcher = FileWatcher()
+# The agent (langgraph/langchain), embeddings (chromadb) and watcher (watchdog) pull in
+# heavy dependencies, so they are imported and constructed in lifespan rather than here.
+if TYPE_CHECKING:
+    from agent import CodeAssistantAgent
+    from embeddings import EmbeddingManager
+    from file_watcher import FileWatcher
+
+CHAT_REQUESTS_IN_PROGRESS = REGISTRY.gauge(
+    "chat_requests_in_progress", "Chat requests currently being processed", ["endpoint"]
+)
+CHAT_REQUESTS = REGISTRY.counter("chat_requests_total", "Chat requests by endpoint and outcome", ["endpoint", "outcome"])
+CHAT_REQUEST_DURATION = REGISTRY.histogram(
+    "chat_request_duration_seconds", "End-to-end chat request latency", ["endpoint"]
+)
+ZIP_BUILD_DURATION = REGISTRY.histogram("zip_build_duration_seconds", "Time spent building project download archives")
+
+agent: Optional["CodeAssistantAgent"] = None
+embedding_manager: Optional["EmbeddingManager"] = None
+file_watcher: Optional["FileWatcher"] = None
+indexing_task: Optional[asyncio.Task] = None
+agent_task: Optional[asyncio.Task] = None
+
+
+def _require_agent() -> "CodeAssistantAgent":
+    if agent is None or agent.graph is None:
+        raise HTTPException(status_code=503, detail="Server is still starting up")
+    return agent
+
+def _require_embedding_manager() -> "EmbeddingManager":
+    if embedding_manager is None:
+        raise HTTPException(status_code=503, detail="Server is still starting up")
+    return embedding_manager
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global agent, embedding_manager, file_watcher, indexing_task, agent_task
     print("Starting up application...")
     os.makedirs("generated_apps", exist_ok=True)
+
+    from agent import CodeAssistantAgent
+    from embeddings import EmbeddingManager
+    from file_watcher import FileWatcher
+
+    agent = CodeAssistantAgent()
+    embedding_manager = EmbeddingManager()
+    file_watcher = FileWatcher()
     
-    await agent.initialize(embedding_manager)
-    await embedding_manager.index_directory("generated_apps")
+    tracer.configure(os.getenv("TELEMETRY_SINKS", "memory"))
+    # The LLM backend (which may load local models) and the index start in the background so
+    # the server accepts traffic straight away. Chat endpoints return 503 until the agent is
+    # up, and edit retrieval answers from the keyword index only until indexing finishes
+    # (see /api/ready).
+    agent_task = asyncio.create_task(_start_agent())
+    indexing_task = asyncio.create_task(_index_workspace())
     
     loop = asyncio.get_event_loop()
     file_watcher.start_watching(embedding_manager, loop)
@@ -34,17 +77,73 @@ async def lifespan(app: FastAPI):
     print("Application startup complete")
     yield
     print("Shutting down application...")
+    for task in (agent_task, indexing_task):
+        if task and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
     file_watcher.stop_watching()
     await agent.shutdown()
+    await agent.llm_client.shutdown()
+    await embedding_manager.close()
+    agent = embedding_manager = file_watcher = None
     print("Application shutdown complete")
 
+async def _start_agent():
+    try:
+        await agent.initialize(embedding_manager) # type: ignore
+        print("Agent ready")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Agent startup failed: {e}")
+        traceback.print_exc()
+
+async def _index_workspace():
+    try:
+        embedding_manager = _require_embedding_manager()
+        await embedding_manager.hydrate_keyword_index()
+        await embedding_manager.index_directory("generated_apps")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Startup indexing failed: {e}")
+        traceback.print_exc()
+
 app = FastAPI(title="Local Code Assistant", lifespan=lifespan)
 
+@app.get("/api/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/api/ready")
+async def ready(require_index: bool = False):
+    agent_ready = agent is not None and agent.graph is not None
+    index = {"warm": False, "keyword_index": False, "state": "pending"}
+    if embedding_manager is not None:
+        index = {
+            "warm": embedding_manager.is_warm(),
+            "keyword_index": embedding_manager.keyword_ready,
+            **embedding_manager.index_progress,
+        }
+    ready = agent_ready and (index["warm"] or not require_index)
+    body = {"status": "ready" if ready else "starting", "agent": agent_ready, "index": index}
+    if file_watcher is not None and file_watcher.reconcile_progress:
+        body["reconcile"] = file_watcher.reconcile_progress
+    if not ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
 @app.post("/api/clear")
-async def clear_session(session_id: str = "default"):
+async def clear_session(session_id: str = "default", purge_caches: bool = False):
+    agent = _require_agent()
+    embedding_manager = _require_embedding_manager()
     try:
         print("--- Clearing project and state ---")
-        await embedding_manager.reset()
+        await embedding_manager.reset(purge_embedding_cache=purge_caches)
+        # Cached responses are keyed by model and prompt, so they stay valid across resets
+        # and are only dropped on request.
+        if purge_caches:
+            await agent.llm_client.clear_cache()
 
         await agent.shutdown()
 
@@ -84,7 +183,7 @@ async def download_project(project_name: str):
     zip_path = os.path.join("generated_apps", zip_filename)
 
     try:
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+        with ZIP_BUILD_DURATION.time(), zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
             for root, _, files in os.walk(project_dir):
                 for fname in files:
                     file_path = os.path.join(root, fname)
@@ -100,6 +199,7 @@ async def download_project(project_name: str):
 class ChatMessage(BaseModel):
     message: str
     session_id: str = "default"
+    use_cache: bool = True
 
 class ChatResponse(BaseModel):
     response: str
@@ -108,13 +208,75 @@ class ChatResponse(BaseModel):
 
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(message: ChatMessage):
+    agent = _require_agent()
+    in_progress = CHAT_REQUESTS_IN_PROGRESS.labels("chat")
+    in_progress.inc()
+    start = time.perf_counter()
+    outcome = "error"
     try:
-        result = await agent.process_message(message.message, message.session_id)
+        result = await agent.process_message(message.message, message.session_id, message.use_cache)
+        outcome = "success"
         return ChatResponse(**result)
     except Exception as e:
         print(f"Error processing chat message: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        in_progress.dec()
+        CHAT_REQUESTS.labels("chat", outcome).inc()
+        CHAT_REQUEST_DURATION.labels("chat").observe(time.perf_counter() - start)
+
+def _sse_event(event: Dict[str, Any]) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream(message: ChatMessage):
+    agent = _require_agent()
+
+    async def event_stream():
+        in_progress = CHAT_REQUESTS_IN_PROGRESS.labels("chat_stream")
+        in_progress.inc()
+        start = time.perf_counter()
+        outcome = "cancelled"
+        try:
+            async for event in agent.stream_message(message.message, message.session_id, message.use_cache):
+                yield _sse_event(event)
+            outcome = "success"
+        except Exception as e:
+            outcome = "error"
+            print(f"Error streaming chat message: {e}")
+            traceback.print_exc()
+            yield _sse_event({"type": "error", "detail": str(e)})
+        finally:
+            in_progress.dec()
+            CHAT_REQUESTS.labels("chat_stream", outcome).inc()
+            CHAT_REQUEST_DURATION.labels("chat_stream").observe(time.perf_counter() - start)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/metrics")
+async def get_metrics(recent_spans: int = 0):
+    agent = _require_agent()
+    embedding_manager = _require_embedding_manager()
+    # Cache stats count rows in SQLite under the lock the cache writers hold, so keep them off the loop.
+    llm_cache_stats = await asyncio.to_thread(agent.llm_client.cache_stats)
+    embedding_cache_stats = await asyncio.to_thread(embedding_manager.cache_stats)
+    return {
+        "nodes": tracer.histograms.snapshot(),
+        "recent_spans": tracer.ring_buffer.snapshot(limit=recent_spans) if recent_spans > 0 else [],
+        "llm_cache": llm_cache_stats,
+        "llm_coalescing": agent.llm_client.coalescing_stats(),
+        "embedding_cache": embedding_cache_stats,
+        "query_embedding_cache": embedding_manager.query_cache_stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/generated/{project_name}/{file_path:path}")
 async def serve_generated_file(project_name: str, file_path: str):
@@ -133,5 +295,7 @@ if __name__ == "__main__":
     parser.add_argument('--host', type=str, default="0.0.0.0", help='Host to run the server on')
     args = parser.parse_args()
     
+    import uvicorn
+
     print(f"Starting server on {args.host}:{args.port}")
     uvicorn.run(app, host=args.host, port=args.port)
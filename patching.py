@@ -0,0 +1,136 @@
+import difflib
+import re
+from typing import List, Tuple
+
+_SEARCH_RE = re.compile(r"^\s*<{5,}\s*SEARCH\s*$")
+_DIVIDER_RE = re.compile(r"^\s*={5,}\s*$")
+_REPLACE_RE = re.compile(r"^\s*>{5,}\s*REPLACE\s*$")
+
+FUZZY_MATCH_THRESHOLD = 0.9
+
+PATCH_INSTRUCTIONS = """Return ONLY the changes, as one or more SEARCH/REPLACE blocks in exactly this format:
+<<<<<<< SEARCH
+(lines copied exactly from the existing code)
+=======
+(the lines that replace them)
+>>>>>>> REPLACE
+Each SEARCH section must match the existing code exactly, including indentation, and contain enough lines to be unique.
+Use an empty SEARCH section to append new code at the end of the file.
+Do not include markdown formatting or explanations."""
+
+
+class PatchApplyError(Exception):
+    pass
+
+
+def parse_search_replace_blocks(text: str) -> List[Tuple[str, str]]:
+    blocks: List[Tuple[str, str]] = []
+    state = "scan"
+    search: List[str] = []
+    replace: List[str] = []
+
+    for line in text.splitlines():
+        if state == "scan":
+            if _SEARCH_RE.match(line):
+                state, search, replace = "search", [], []
+        elif state == "search":
+            if _DIVIDER_RE.match(line):
+                state = "replace"
+            else:
+                search.append(line)
+        elif state == "replace":
+            if _REPLACE_RE.match(line):
+                blocks.append(("\n".join(search), "\n".join(replace)))
+                state = "scan"
+            else:
+                replace.append(line)
+
+    if state != "scan":
+        raise PatchApplyError("Unterminated SEARCH/REPLACE block")
+    if not blocks:
+        raise PatchApplyError("No SEARCH/REPLACE blocks found")
+    return blocks
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _find_unique(matches: List[int], description: str) -> int:
+    if len(matches) > 1:
+        raise PatchApplyError(f"SEARCH section matches {len(matches)} places ({description})")
+    return matches[0] if matches else -1
+
+
+def _apply_block(original: str, search: str, replace: str) -> str:
+    if not search.strip():
+        separator = "" if not original or original.endswith("\n") else "\n"
+        return f"{original}{separator}{replace}\n"
+
+    # 1. Exact substring match.
+    occurrences = original.count(search)
+    if occurrences == 1:
+        return original.replace(search, replace, 1)
+    if occurrences > 1:
+        raise PatchApplyError(f"SEARCH section matches {occurrences} places (exact)")
+
+    lines = original.splitlines()
+    search_lines = search.splitlines()
+    # Models often drop or add blank lines around the block; they carry no meaning for matching.
+    while search_lines and not search_lines[0].strip():
+        search_lines.pop(0)
+    while search_lines and not search_lines[-1].strip():
+        search_lines.pop()
+    window = len(search_lines)
+    replace_lines = replace.splitlines()
+    trailing_newline = "\n" if original.endswith("\n") else ""
+
+    def splice(start: int) -> str:
+        # Stages 2 and 3 tolerate indentation drift, so shift the REPLACE lines from the
+        # SEARCH section's indentation to that of the block actually matched.
+        source_indent = _indent(search_lines[0])
+        target_indent = _indent(lines[start])
+        replacement = replace_lines
+        if source_indent != target_indent:
+            replacement = [
+                target_indent + (line[len(source_indent):] if line.startswith(source_indent) else line.lstrip())
+                if line.strip() else line
+                for line in replace_lines
+            ]
+        return "\n".join(lines[:start] + replacement + lines[start + window:]) + trailing_newline
+
+    # 2. Same lines, ignoring indentation and trailing whitespace.
+    stripped_search = [line.strip() for line in search_lines]
+    stripped_lines = [line.strip() for line in lines]
+    start = _find_unique(
+        [i for i in range(len(lines) - window + 1) if stripped_lines[i:i + window] == stripped_search],
+        "whitespace-insensitive",
+    )
+    if start >= 0:
+        return splice(start)
+
+    # 3. Closest window of the same length, if it is close enough.
+    best_ratio, best_starts = 0.0, []
+    needle = "\n".join(stripped_search)
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    matcher.set_seq2(needle)
+    for i in range(len(lines) - window + 1):
+        matcher.set_seq1("\n".join(stripped_lines[i:i + window]))
+        if matcher.real_quick_ratio() < FUZZY_MATCH_THRESHOLD or matcher.quick_ratio() < FUZZY_MATCH_THRESHOLD:
+            continue
+        ratio = matcher.ratio()
+        if ratio > best_ratio:
+            best_ratio, best_starts = ratio, [i]
+        elif ratio == best_ratio:
+            best_starts.append(i)
+    if best_ratio >= FUZZY_MATCH_THRESHOLD:
+        return splice(_find_unique(best_starts, f"fuzzy, ratio {best_ratio:.2f}"))
+
+    raise PatchApplyError("SEARCH section not found in the existing code")
+
+
+def apply_search_replace(original: str, blocks: List[Tuple[str, str]]) -> str:
+    updated = original
+    for search, replace in blocks:
+        updated = _apply_block(updated, search, replace)
+    return updated
@@ -0,0 +1,210 @@
+import contextvars
+import math
+import threading
+import time
+import traceback
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, math.inf)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    # Roughly four characters per token for English prose and code.
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+class Span:
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_time = time.time()
+        self.end_time: Optional[float] = None
+        self.duration_ms: Optional[float] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self._start = time.perf_counter()
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add(self, key: str, amount: float = 1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        self.end_time = self.start_time + self.duration_ms / 1000
+        if error is not None:
+            self.status = "error"
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class LogSpanSink:
+    def export(self, span: Span):
+        attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+        print(f"[span] {span.name} {span.duration_ms:.1f}ms status={span.status} {attributes}".rstrip())
+
+
+class RingBufferSpanSink:
+    def __init__(self, capacity: int = 1000):
+        self.spans: Deque[Span] = deque(maxlen=capacity)
+
+    def export(self, span: Span):
+        self.spans.append(span)
+
+    def snapshot(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        spans = list(self.spans)
+        if limit is not None:
+            spans = spans[-limit:]
+        return [span.to_dict() for span in spans]
+
+
+class OpenTelemetrySpanSink:
+    # Re-emits finished spans through the OpenTelemetry API, so whatever exporter the
+    # process has configured (OTLP, console, ...) receives them.
+    def __init__(self, instrumentation_name: str = "website-builder"):
+        from opentelemetry import trace
+
+        self._trace = trace
+        self.tracer = trace.get_tracer(instrumentation_name)
+
+    def export(self, span: Span):
+        attributes = {
+            key: value for key, value in span.attributes.items()
+            if isinstance(value, (str, bool, int, float))
+        }
+        otel_span = self.tracer.start_span(
+            span.name,
+            start_time=int(span.start_time * 1e9),
+            attributes=attributes,
+        )
+        if span.status == "error":
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int((span.end_time or span.start_time) * 1e9))
+
+
+class SpanHistograms:
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS, reservoir_size: int = 1024):
+        self.buckets_ms = buckets_ms
+        self.reservoir_size = reservoir_size
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def export(self, span: Span):
+        duration = span.duration_ms or 0.0
+        with self._lock:
+            stats = self._stats.get(span.name)
+            if stats is None:
+                stats = {
+                    "count": 0,
+                    "errors": 0,
+                    "sum_ms": 0.0,
+                    "buckets": [0] * len(self.buckets_ms),
+                    "recent_ms": deque(maxlen=self.reservoir_size),
+                    "totals": defaultdict(float),
+                }
+                self._stats[span.name] = stats
+            stats["count"] += 1
+            stats["errors"] += span.status == "error"
+            stats["sum_ms"] += duration
+            stats["recent_ms"].append(duration)
+            for index, bound in enumerate(self.buckets_ms):
+                if duration <= bound:
+                    stats["buckets"][index] += 1
+                    break
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stats["totals"][key] += value
+
+    @staticmethod
+    def _percentile(values: List[float], pct: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result = {}
+            for name, stats in sorted(self._stats.items()):
+                recent = list(stats["recent_ms"])
+                result[name] = {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "mean_ms": stats["sum_ms"] / stats["count"] if stats["count"] else 0.0,
+                    "p50_ms": self._percentile(recent, 50),
+                    "p95_ms": self._percentile(recent, 95),
+                    "p99_ms": self._percentile(recent, 99),
+                    "buckets_ms": {
+                        ("+Inf" if bound == math.inf else str(bound)): count
+                        for bound, count in zip(self.buckets_ms, stats["buckets"])
+                    },
+                    "totals": dict(stats["totals"]),
+                }
+            return result
+
+
+class Tracer:
+    def __init__(self):
+        self.histograms = SpanHistograms()
+        self.ring_buffer = RingBufferSpanSink()
+        self.sinks: List[Any] = [self.histograms, self.ring_buffer]
+
+    def configure(self, sink_names: str):
+        # The histogram and ring buffer are always on; "log" and "otel" are opt-in.
+        self.sinks = [self.histograms, self.ring_buffer]
+        for name in filter(None, (part.strip() for part in sink_names.split(","))):
+            if name == "log":
+                self.sinks.append(LogSpanSink())
+            elif name == "otel":
+                try:
+                    self.sinks.append(OpenTelemetrySpanSink())
+                except ImportError:
+                    print("[WARN] opentelemetry-api is not installed; the 'otel' span sink is disabled.")
+            elif name != "memory":
+                print(f"[WARN] Unknown span sink '{name}' ignored.")
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        span = Span(name, attributes)
+        token = _current_span.set(span)
+        error: Optional[BaseException] = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish(error)
+            self._export(span)
+
+    def _export(self, span: Span):
+        for sink in self.sinks:
+            try:
+                sink.export(span)
+            except Exception as e:
+                print(f"[WARN] Span sink {type(sink).__name__} failed: {e}")
+                traceback.print_exc()
+
+
+tracer = Tracer()
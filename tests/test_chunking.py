@@ -0,0 +1,35 @@
+from chunking import chunk_file
+
+
+def _covered_text(chunks):
+    return "\n".join(chunk.text for chunk in chunks)
+
+
+def test_unclosed_top_level_element_keeps_rest_of_document():
+    body = "\n".join(f"<div class=\"row-{index}\">Row {index}</div>" for index in range(400))
+    html = f"<html><body>\n<header>H</header>\n<p>intro\n<section>\n{body}\n</section>\n</body></html>\n"
+
+    chunks = chunk_file("site/index.html", html)
+
+    text = _covered_text(chunks)
+    assert "<header>H</header>" in text
+    assert "Row 0" in text
+    assert "Row 399" in text
+    assert sum(len(chunk.text) for chunk in chunks) >= len(html.strip()) * 0.8
+
+
+def test_unclosed_element_without_body_end_tag():
+    html = "<header>H</header>\n<div>\n" + "\n".join(f"<span>{index}</span>" for index in range(50)) + "\n"
+
+    chunks = chunk_file("site/index.html", html)
+
+    assert "<span>49</span>" in _covered_text(chunks)
+
+
+def test_closed_elements_are_chunked_structurally():
+    html = "<html><body>\n<header>\nH\n</header>\n<footer>\nF\n</footer>\n</body></html>\n"
+
+    chunks = chunk_file("site/index.html", html)
+
+    assert [chunk.start_line for chunk in chunks] == [2]
+    assert "<footer>" in chunks[0].text
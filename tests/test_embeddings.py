@@ -0,0 +1,48 @@
+import asyncio
+import os
+
+from embedding_backends import FakeEmbeddingBackend
+from embeddings import EmbeddingManager
+
+
+def _write(path, content):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def test_overlapping_index_file_calls_leave_no_orphaned_chunks(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_CACHE_ENABLED", "0")
+    monkeypatch.setenv("FAKE_EMBEDDING_LATENCY_MS", "200")
+    workspace = tmp_path / "generated_apps"
+    (workspace / "site").mkdir(parents=True)
+    path = str(workspace / "site" / "app.js")
+
+    async def run():
+        manager = EmbeddingManager(
+            db_path=str(tmp_path / "db"), workspace_dir=str(workspace), backend=FakeEmbeddingBackend()
+        )
+        manager.keyword_ready = True
+        try:
+            _write(path, "function a() { return 1; }\n")
+            await manager.index_file(path)
+
+            # The second run is planned while the first is still embedding its new chunk.
+            _write(path, "function b() { return 2; }\n")
+            first = asyncio.create_task(manager.index_file(path))
+            await asyncio.sleep(0.05)
+            _write(path, "function cc() { return 33; }\n")
+            second = asyncio.create_task(manager.index_file(path))
+            await asyncio.gather(first, second)
+
+            stored = set(manager.collection.get(where={"source": path}, include=[])["ids"])
+            assert stored == set(manager.manifest.get(path)["chunk_ids"])
+            assert manager.keyword_index.search("b", 5) == []
+
+            _write(path, "function d() { return 4; }\n")
+            await manager.index_file(path)
+            texts = manager.collection.get(where={"source": path}, include=["documents"])["documents"]
+            assert texts == ["function d() { return 4; }"]
+        finally:
+            await manager.close()
+
+    asyncio.run(run())
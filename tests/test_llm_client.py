@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from llm_client import SingleFlight, StreamingSingleFlight
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    async def run():
+        flight = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(flight.do("key", work), flight.do("key", work))
+        return results, calls, flight
+
+    results, calls, flight = asyncio.run(run())
+    assert results == ["result", "result"]
+    assert calls == 1
+    assert flight.coalesced == 1
+    assert flight.in_flight() == 0
+
+
+def test_single_flight_cancels_only_when_every_caller_is_gone():
+    async def run():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        release = asyncio.Event()
+        cancelled = False
+
+        async def work():
+            nonlocal cancelled
+            started.set()
+            try:
+                await release.wait()
+                return "done"
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        first = asyncio.create_task(flight.do("key", work))
+        second = asyncio.create_task(flight.do("key", work))
+        await started.wait()
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        assert not cancelled
+        release.set()
+        assert await second == "done"
+
+        started.clear()
+        release.clear()
+        third = asyncio.create_task(flight.do("other", work))
+        await started.wait()
+        third.cancel()
+        await asyncio.gather(third, return_exceptions=True)
+        await asyncio.sleep(0)
+        return cancelled, flight.in_flight()
+
+    assert asyncio.run(run()) == (True, 0)
+
+
+def test_streaming_single_flight_replays_chunks_to_late_subscribers():
+    async def run():
+        flight = StreamingSingleFlight()
+        calls = 0
+
+        async def stream():
+            nonlocal calls
+            calls += 1
+            for chunk in ("a", "b", "c"):
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        async def collect(delay):
+            await asyncio.sleep(delay)
+            return [chunk async for chunk in flight.subscribe("key", stream)]
+
+        results = await asyncio.gather(collect(0), collect(0.015))
+        return results, calls, flight
+
+    results, calls, flight = asyncio.run(run())
+    assert results == [["a", "b", "c"], ["a", "b", "c"]]
+    assert calls == 1
+    assert flight.coalesced == 1
+    assert flight.in_flight() == 0
+
+
+def test_streaming_single_flight_raises_producer_error_to_every_subscriber():
+    async def run():
+        flight = StreamingSingleFlight()
+
+        async def stream():
+            yield "a"
+            await asyncio.sleep(0.01)
+            raise RuntimeError("backend failed")
+
+        async def collect():
+            chunks = []
+            with pytest.raises(RuntimeError, match="backend failed"):
+                async for chunk in flight.subscribe("key", stream):
+                    chunks.append(chunk)
+            return chunks
+
+        return await asyncio.gather(collect(), collect())
+
+    assert asyncio.run(run()) == [["a"], ["a"]]
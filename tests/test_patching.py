@@ -0,0 +1,83 @@
+import pytest
+
+from patching import PatchApplyError, apply_search_replace, parse_search_replace_blocks
+
+CSS = """.header {
+    color: red;
+    padding: 10px;
+}
+
+.footer {
+    color: gray;
+}
+"""
+
+
+def _block(search: str, replace: str) -> str:
+    return f"<<<<<<< SEARCH\n{search}\n=======\n{replace}\n>>>>>>> REPLACE\n"
+
+
+def _apply(original: str, patch: str) -> str:
+    return apply_search_replace(original, parse_search_replace_blocks(patch))
+
+
+def test_exact_match():
+    patched = _apply(CSS, _block("    color: red;", "    color: blue;"))
+
+    assert "color: blue;" in patched
+    assert "color: red;" not in patched
+    assert patched.count("color: gray;") == 1
+
+
+def test_whitespace_insensitive_match_keeps_file_indentation():
+    patch = _block(".header {\ncolor: red;\npadding: 10px;\n}", ".header {\ncolor: blue;\npadding: 12px;\n}")
+
+    patched = _apply(CSS, patch)
+
+    assert patched.startswith(".header {\ncolor: blue;\npadding: 12px;\n}\n")
+
+
+def test_whitespace_insensitive_match_reindents_replacement():
+    original = "function init() {\n    if (ready) {\n        start();\n    }\n}\n"
+    patch = _block("if (ready) {\n    start();\n}", "if (ready) {\n    start();\n    log();\n}")
+
+    patched = _apply(original, patch)
+
+    assert patched == "function init() {\n    if (ready) {\n        start();\n        log();\n    }\n}\n"
+
+
+def test_fuzzy_match():
+    patch = _block(".header {\n    color: red;\n    padding: 10px\n}", ".header {\n    color: blue;\n    padding: 10px;\n}")
+
+    patched = _apply(CSS, patch)
+
+    assert "color: blue;" in patched
+    assert "color: red;" not in patched
+
+
+def test_ambiguous_match_raises():
+    original = ".a {\n    color: red;\n}\n.b {\n    color: red;\n}\n"
+
+    with pytest.raises(PatchApplyError, match="matches 2 places"):
+        _apply(original, _block("    color: red;", "    color: blue;"))
+
+
+def test_missing_search_raises():
+    with pytest.raises(PatchApplyError, match="not found"):
+        _apply(CSS, _block(".sidebar {\n    width: 200px;\n}", ".sidebar {\n    width: 240px;\n}"))
+
+
+def test_empty_search_appends():
+    patched = _apply(CSS.rstrip("\n"), _block("", ".new {\n    margin: 0;\n}"))
+
+    assert patched == CSS + ".new {\n    margin: 0;\n}\n"
+
+
+def test_unterminated_block_raises():
+    with pytest.raises(PatchApplyError, match="Unterminated"):
+        parse_search_replace_blocks("<<<<<<< SEARCH\n    color: red;\n=======\n    color: blue;\n")
+
+
+def test_no_blocks_raises():
+    with pytest.raises(PatchApplyError, match="No SEARCH/REPLACE blocks"):
+        parse_search_replace_blocks(".header { color: blue; }")
@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class WriteTokens:
+    # Records files the app wrote (and indexed) itself, so the file watcher can tell the
+    # echo of its own writes from a genuine manual edit. A token is registered before the
+    # write with the expected size and completed afterwards with the resulting mtime; an
+    # event is an echo while the file on disk still matches the token.
+    def __init__(self, ttl_seconds: float = 30.0):
+        self.ttl_seconds = ttl_seconds
+        self._tokens: Dict[str, Tuple[int, Optional[int], float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    def expect(self, path: str, size: int):
+        with self._lock:
+            self._tokens[self._key(path)] = (size, None, time.monotonic() + self.ttl_seconds)
+
+    def complete(self, path: str):
+        stat = os.stat(path)
+        with self._lock:
+            self._tokens[self._key(path)] = (stat.st_size, stat.st_mtime_ns, time.monotonic() + self.ttl_seconds)
+
+    def discard(self, path: str):
+        with self._lock:
+            self._tokens.pop(self._key(path), None)
+
+    def is_echo(self, path: str) -> bool:
+        key = self._key(path)
+        with self._lock:
+            token = self._tokens.get(key)
+            if token is None:
+                return False
+            if token[2] < time.monotonic():
+                del self._tokens[key]
+                return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        size, mtime_ns, _ = token
+        return stat.st_size == size and (mtime_ns is None or stat.st_mtime_ns == mtime_ns)
+
+
+write_tokens = WriteTokens(float(os.getenv("WRITE_TOKEN_TTL_SECONDS", "30")))